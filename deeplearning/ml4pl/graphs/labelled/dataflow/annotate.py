@@ -41,6 +41,7 @@ and text format protocol buffers:
 import signal
 import subprocess
 import sys
+import threading
 from typing import List
 from typing import Union
 
@@ -240,20 +241,35 @@ def Annotate(
       f"Available analyses: {AVAILABLE_ANALYSES}",
     )
 
+  # SIGALRM handlers can only be installed from the main thread. When called
+  # from any other thread, fall back to running the analysis in a subprocess,
+  # which is killed if it exceeds the timeout.
+  if threading.current_thread() is not threading.main_thread():
+    annotated_graphs = _AnnotateInSubprocess(
+      analysis,
+      graph,
+      n=n,
+      timeout=timeout,
+      binary_graph=isinstance(graph, bytes),
+    )
+    return data_flow_graphs.ProgramGraphsDataFlowGraphs(
+      list(annotated_graphs.graph)
+    )
+
   def TimeoutHandler(signum, frame):
     """Callback to raise a timeout error."""
     del signum
     del frame
     raise data_flow_graphs.AnalysisTimeout(timeout)
 
-  signal.signal(signal.SIGALRM, TimeoutHandler)
+  previous_handler = signal.signal(signal.SIGALRM, TimeoutHandler)
   signal.alarm(timeout)
-  annotator = ANALYSES[analysis](graph)
-
   try:
+    annotator = ANALYSES[analysis](graph)
     annotated_graphs = annotator.MakeAnnotated(n)
   finally:
     signal.alarm(0)
+    signal.signal(signal.SIGALRM, previous_handler)
 
   return annotated_graphs
 
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Test the annotate binary."""
+import threading
+
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow import annotate
@@ -85,6 +87,22 @@ def test_timeout(one_proto: programl_pb2.ProgramGraph):
     annotate.Annotate("test_timeout", one_proto, timeout=1)
 
 
+def test_timeout_from_thread(one_proto: programl_pb2.ProgramGraph):
+  """Test that the timeout is enforced when not called from the main thread."""
+  errors = []
+
+  def Worker():
+    try:
+      annotate.Annotate("test_timeout", one_proto, timeout=1)
+    except data_flow_graphs.AnalysisTimeout as e:
+      errors.append(e)
+
+  thread = threading.Thread(target=Worker)
+  thread.start()
+  thread.join()
+  assert len(errors) == 1
+
+
 def test_annotate(analysis: str, real_proto: programl_pb2.ProgramGraph, n: int):
   """Test all annotators over all real protos."""
   try:
@@ -67,6 +67,23 @@ class NetworkxDataFlowGraphs(DataFlowGraphs):
     return [programl.NetworkXToProgramGraph(g) for g in self.graphs]
 
 
+class ProgramGraphsDataFlowGraphs(DataFlowGraphs):
+  """A set of data-flow annotated graphs backed by protocol buffers."""
+
+  def __init__(self, protos: List[programl_pb2.ProgramGraph]):
+    self._protos = protos
+
+  @property
+  def graphs(self) -> List[nx.MultiDiGraph]:
+    """Convert the program graph protos to networkx graphs."""
+    return [programl.ProgramGraphToNetworkX(proto) for proto in self.protos]
+
+  @property
+  def protos(self) -> List[programl_pb2.ProgramGraph]:
+    """Access the underlying program graph protos."""
+    return self._protos
+
+
 ###############################################################################
 # Analysis errors.
 ###############################################################################
@@ -167,8 +184,9 @@ class NetworkXDataFlowGraphAnnotator(DataFlowGraphAnnotator):
       AnalysisTimeout: If the analysis times out.
     """
     if n and n < len(self.root_nodes):
-      random.shuffle(self.root_nodes)
-      root_nodes = self.root_nodes[:n]
+      # Sample without replacement, rather than shuffling the entire list of
+      # root nodes only to discard all but the first n.
+      root_nodes = random.sample(self.root_nodes, n)
     else:
       root_nodes = self.root_nodes
 
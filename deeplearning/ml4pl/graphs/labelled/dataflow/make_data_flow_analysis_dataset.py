@@ -14,17 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """This module prepares datasets for data flow analyses."""
+import contextlib
 import multiprocessing
 import pathlib
 import resource
 import sys
+import threading
 import time
 import traceback
 from typing import Iterable
 from typing import List
 from typing import NamedTuple
-from typing import Tuple
+from typing import Optional
 
+import numpy as np
 import psutil
 import sqlalchemy as sql
 
@@ -34,6 +37,7 @@ from deeplearning.ml4pl.graphs.labelled.dataflow import annotate
 from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
 from labm8.py import app
 from labm8.py import humanize
+from labm8.py import labtypes
 from labm8.py import ppar
 from labm8.py import progress
 from labm8.py import sqlutil
@@ -72,6 +76,12 @@ app.DEFINE_integer(
   "Tuning parameter. The number of megabytes of protocol buffers to read in "
   "a batch.",
 )
+app.DEFINE_integer(
+  "max_ids_per_query",
+  512,
+  "Tuning parameter. The maximum number of IDs to look up in a single "
+  "query when reading protos in random order.",
+)
 app.DEFINE_integer(
   "max_reader_queue_size",
   3,
@@ -125,60 +135,101 @@ class ProgramGraphProto(NamedTuple):
 
 def BatchedProtoReader(
   proto_db: unlabelled_graph_database.Database,
-  ids_and_sizes_to_do: List[Tuple[int, int]],
+  ids_to_do: np.array,
+  sizes_to_do: np.array,
   batch_size_in_bytes: int,
   order_by: str,
   ctx: progress.ProgressBarContext,
 ) -> Iterable[List[ProgramGraphProto]]:
-  """Read from the given list of IDs in batches."""
-  ids_and_sizes_to_do = sorted(ids_and_sizes_to_do, key=lambda x: x[0])
-  i = 0
-  while i < len(ids_and_sizes_to_do):
-    end_i = i
-    batch_size = 0
-    while batch_size < batch_size_in_bytes:
-      batch_size += ids_and_sizes_to_do[end_i][1]
-      end_i += 1
-      if end_i >= len(ids_and_sizes_to_do):
-        # We have run out of graphs to read.
-        break
-
-    with proto_db.Session() as session:
+  """Read from the given list of IDs in batches.
+
+  Args:
+    proto_db: The database to read protos from.
+    ids_to_do: An array of IR IDs to read.
+    sizes_to_do: An array of the serialized proto sizes of each of ids_to_do.
+    batch_size_in_bytes: The target size of each batch.
+    order_by: The order to read the protos in. One of {in_order,random}.
+    ctx: The logging context.
+
+  Returns:
+    An iterator over batches of protos.
+  """
+  # The IDs to do are already in the order that they should be read. For
+  # in-order reading, the range queries below require them to be sorted.
+  if __debug__ and order_by == "in_order":
+    assert np.all(ids_to_do[1:] >= ids_to_do[:-1]), "IDs are not sorted"
+  # The running total of proto sizes, used to find batch boundaries.
+  cumulative_sizes = np.cumsum(sizes_to_do)
+  # Skip formatting profiling messages that would not be logged.
+  profile = app.GetVerbosity() >= 2
+  # Use a single session for the lifetime of the reader, rather than checking
+  # out a connection and beginning a new transaction for every batch. Rows
+  # are selected as plain columns, so the identity map does not grow.
+  with proto_db.Session() as session:
+    i = 0
+    while i < len(ids_to_do):
+      # Find the smallest batch starting at i whose total size is at least
+      # batch_size_in_bytes, or the remainder of the graphs to read.
+      batch_start_size = int(cumulative_sizes[i - 1]) if i else 0
+      end_i = min(
+        int(
+          np.searchsorted(
+            cumulative_sizes, batch_start_size + batch_size_in_bytes
+          )
+        )
+        + 1,
+        len(ids_to_do),
+      )
+      batch_size = int(cumulative_sizes[end_i - 1]) - batch_start_size
+
       with ctx.Profile(
         2,
         f"[reader] Read {humanize.BinaryPrefix(batch_size, 'B')} "
         f"batch of {end_i - i} unlabelled graphs",
-      ):
-        graphs = session.query(unlabelled_graph_database.ProgramGraph).options(
-          sql.orm.joinedload(unlabelled_graph_database.ProgramGraph.data)
-        )
+      ) if profile else contextlib.nullcontext():
+        # Select only the columns that we need, rather than hydrating ORM
+        # objects for every graph and its data.
+        query = session.query(
+          unlabelled_graph_database.ProgramGraph.ir_id,
+          unlabelled_graph_database.ProgramGraphData.serialized_proto,
+        ).join(unlabelled_graph_database.ProgramGraph.data)
         if order_by == "in_order":
           # For in-order reading, we can do fast range checks on the IR id.
-          start_id = ids_and_sizes_to_do[i][0]
-          end_id = ids_and_sizes_to_do[end_i - 1][0]
-          graphs = graphs.filter(
-            unlabelled_graph_database.ProgramGraph.ir_id >= start_id,
-            unlabelled_graph_database.ProgramGraph.ir_id <= end_id,
-          )
+          # The IDs to do are every ID greater than the last one processed, so
+          # a range never includes graphs which have already been processed.
+          start_id = int(ids_to_do[i])
+          end_id = int(ids_to_do[end_i - 1])
+          queries = [
+            query.filter(
+              unlabelled_graph_database.ProgramGraph.ir_id >= start_id,
+              unlabelled_graph_database.ProgramGraph.ir_id <= end_id,
+            )
+          ]
         elif order_by == "random":
           # For random order, have to do set lookups on each ID in the batch.
-          batch_ids_and_sizes = ids_and_sizes_to_do[i:end_i]
-          batch_ids = [x[0] for x in batch_ids_and_sizes]
-          graphs = graphs.filter(
-            unlabelled_graph_database.ProgramGraph.ir_id.in_(batch_ids),
-          )
+          # Split the lookups into chunks to bound the number of parameters in
+          # each query, since a batch of small graphs can contain thousands of
+          # IDs.
+          batch_ids = ids_to_do[i:end_i].tolist()
+          queries = [
+            query.filter(
+              unlabelled_graph_database.ProgramGraph.ir_id.in_(chunk),
+            )
+            for chunk in labtypes.Chunkify(batch_ids, FLAGS.max_ids_per_query)
+          ]
         else:
           raise app.UsageError(f"Unknown order: {order_by}")
 
-        graphs = graphs.all()
-      yield [
-        ProgramGraphProto(
-          ir_id=graph.ir_id, serialized_proto=graph.data.serialized_proto
-        )
-        for graph in graphs
-      ]
+        graphs = [
+          ProgramGraphProto(
+            ir_id=row.ir_id, serialized_proto=row.serialized_proto
+          )
+          for query in queries
+          for row in query
+        ]
+      yield graphs
 
-    i = end_i
+      i = end_i
 
 
 class AnnotationResult(NamedTuple):
@@ -189,6 +240,36 @@ class AnnotationResult(NamedTuple):
   graph_tuples: List[graph_tuple_database.GraphTuple]
 
 
+# The name of the analysis to run and the logging context of a worker process.
+# These are set once per process by ProcessWorkerInitializer() so that they are
+# not sent with every task.
+_worker_analysis: Optional[str] = None
+_worker_ctx: progress.ProgressContext = progress.NullContext
+_worker_profile: bool = False
+
+
+def ProcessWorkerInitializer(
+  analysis: str, max_mem_size: int, ctx: progress.ProgressContext
+) -> None:
+  """The process pool worker initializer.
+
+  This is called once when each worker process in the pool is started.
+  """
+  global _worker_analysis
+  global _worker_ctx
+  global _worker_profile
+  _worker_analysis = analysis
+  _worker_ctx = ctx
+  # Skip profiling batches when the profiling messages would not be logged.
+  _worker_profile = app.GetVerbosity() >= 2
+
+  # Set the hard limit on the memory size. Exceeding this limit will raise
+  # a MemoryError.
+  if FLAGS.limit_worker_mem:
+    resource.setrlimit(resource.RLIMIT_DATA, (max_mem_size, max_mem_size))
+    resource.setrlimit(resource.RLIMIT_AS, (max_mem_size, max_mem_size))
+
+
 def ProcessWorker(packed_args) -> AnnotationResult:
   """The process pool worker function.
 
@@ -201,16 +282,9 @@ def ProcessWorker(packed_args) -> AnnotationResult:
   # Index into the tuple rather than arg unpacking so that we can assign
   # type annotations.
   worker_id: str = f"{packed_args[0]:06d}"
-  max_mem_size: int = packed_args[1]
-  analysis: str = packed_args[2]
-  program_graphs: List[ProgramGraphProto] = packed_args[3]
-  ctx: progress.ProgressBarContext = packed_args[4]
-
-  # Set the hard limit on the memory size. Exceeding this limit will raise
-  # a MemoryError.
-  if FLAGS.limit_worker_mem:
-    resource.setrlimit(resource.RLIMIT_DATA, (max_mem_size, max_mem_size))
-    resource.setrlimit(resource.RLIMIT_AS, (max_mem_size, max_mem_size))
+  program_graphs: List[ProgramGraphProto] = packed_args[1]
+  analysis: str = _worker_analysis
+  ctx: progress.ProgressContext = _worker_ctx
 
   graph_tuples = []
 
@@ -227,7 +301,7 @@ def ProcessWorker(packed_args) -> AnnotationResult:
       f"[worker {worker_id}] processed {len(program_graphs)} protos "
       f"({len(graph_tuples)} graphs, {humanize.Duration(t / len(program_graphs))} /proto)"
     ),
-  ):
+  ) if _worker_profile else contextlib.nullcontext():
     for i, program_graph in enumerate(program_graphs):
       try:
         annotated_graphs = annotate.Annotate(
@@ -331,11 +405,15 @@ class DatasetGenerator(progress.Progress):
       elif order_by == "random":
         # Filter out the graphs that have already been processed.
         if already_done_count:
+          # An IR may produce many graph tuples, so select only the distinct
+          # IDs rather than streaming a row for every graph.
           already_done_ids = {
             row.ir_id
-            for row in out_session.query(graph_tuple_database.GraphTuple.ir_id)
+            for row in out_session.query(
+              graph_tuple_database.GraphTuple.ir_id
+            ).distinct()
           }
-          assert already_done_ids != already_done_count
+          assert len(already_done_ids) == already_done_count
           ids_and_sizes_to_do = ids_and_sizes_to_do.filter(
             ~unlabelled_graph_database.ProgramGraph.ir_id.in_(already_done_ids)
           )
@@ -347,16 +425,28 @@ class DatasetGenerator(progress.Progress):
       # Optionally limit the number of IDs to process.
       if max_instances:
         ids_and_sizes_to_do = ids_and_sizes_to_do.limit(max_instances)
-      ids_and_sizes_to_do = [
-        (row.ir_id, row.serialized_proto_size) for row in ids_and_sizes_to_do
-      ]
+      # Keep the IDs and sizes as arrays rather than a list of tuples for the
+      # lifetime of the reader, which uses ~4x less memory on databases of
+      # millions of graphs.
+      ids_and_sizes_to_do = ids_and_sizes_to_do.all()
+      ids_to_do = np.fromiter(
+        (row.ir_id for row in ids_and_sizes_to_do),
+        dtype=np.int64,
+        count=len(ids_and_sizes_to_do),
+      )
+      sizes_to_do = np.fromiter(
+        (row.serialized_proto_size for row in ids_and_sizes_to_do),
+        dtype=np.int64,
+        count=len(ids_and_sizes_to_do),
+      )
+      del ids_and_sizes_to_do
 
     # Sanity check.
     if not max_instances:
-      if len(ids_and_sizes_to_do) + already_done_count != total_graph_count:
+      if len(ids_to_do) + already_done_count != total_graph_count:
         raise OSError(
           "ids_to_do(%s) + already_done(%s) != total_rows(%s)",
-          len(ids_and_sizes_to_do),
+          len(ids_to_do),
           already_done_count,
           total_graph_count,
         )
@@ -370,7 +460,7 @@ class DatasetGenerator(progress.Progress):
     app.Log(
       1,
       "Selected %s of %s to process",
-      humanize.Commas(len(ids_and_sizes_to_do)),
+      humanize.Commas(len(ids_to_do)),
       humanize.Plural(total_graph_count, "unlabelled graph"),
     )
 
@@ -381,7 +471,8 @@ class DatasetGenerator(progress.Progress):
     self.graph_reader = ppar.ThreadedIterator(
       BatchedProtoReader(
         input_db,
-        ids_and_sizes_to_do,
+        ids_to_do,
+        sizes_to_do,
         FLAGS.proto_batch_mb * 1024 * 1024,
         order_by,
         self.ctx.ToProgressContext(),
@@ -407,19 +498,27 @@ class DatasetGenerator(progress.Progress):
     )
 
     pool = multiprocessing.Pool(
-      processes=FLAGS.nproc, maxtasksperchild=FLAGS.max_tasks_per_worker
+      processes=FLAGS.nproc,
+      maxtasksperchild=FLAGS.max_tasks_per_worker,
+      initializer=ProcessWorkerInitializer,
+      initargs=(
+        self.analysis,
+        per_worker_memory,
+        self.ctx.ToProgressContext(),
+      ),
     )
 
+    # Bound the number of batches between the reader and the writer. The pool
+    # buffers results without limit, so without this a writer that falls behind
+    # would let completed graph tuples accumulate in memory. Instead, the pool
+    # blocks on reading new inputs until the writer catches up.
+    batches_in_flight = threading.BoundedSemaphore(2 * FLAGS.nproc)
+
     def ProcessWorkerArgsGenerator(graph_reader):
       """Generate packed arguments for a multiprocessing worker."""
       for i, graph_batch in enumerate(graph_reader):
-        yield (
-          i,
-          per_worker_memory,
-          self.analysis,
-          graph_batch,
-          self.ctx.ToProgressContext(),
-        )
+        batches_in_flight.acquire()
+        yield (i, graph_batch)
 
     # Have a thread generating inputs, a pool of processes processing them,
     # and another thread writing their results to the database.
@@ -440,6 +539,7 @@ class DatasetGenerator(progress.Progress):
         # Record the generated annotated graphs.
         tuple_sizes = [t.pickled_graph_tuple_size for t in graph_tuples]
         writer.AddMany(graph_tuples, sizes=tuple_sizes)
+        batches_in_flight.release()
 
     # End of buffered writing, this will block until the last results have been
     # committed.
@@ -18,7 +18,6 @@ from typing import List
 
 import numpy as np
 import sqlalchemy as sql
-from sklearn import model_selection
 
 from deeplearning.ml4pl.graphs.labelled import graph_database_reader
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
@@ -56,21 +55,58 @@ class StratifiedGraphLabelKFold(object):
       reader = graph_database_reader.BufferedGraphReader(db)
 
       graph_ids: List[int] = []
-      graph_y: List[int] = []
+      graph_ys: List[np.array] = []
       for graph in reader:
         graph_ids.append(graph.id)
-        graph_y.append(np.argmax(graph.tuple.graph_y))
+        graph_ys.append(graph.tuple.graph_y)
       graph_ids = np.array(graph_ids, dtype=np.int32)
-      graph_y = np.array(graph_y, dtype=np.int64)
+      # Reduce the one-hot labels to class indices in a single vectorized pass
+      # over a (graph_count, graph_y_dimensionality) matrix.
+      graph_y = (
+        np.vstack(graph_ys).argmax(axis=1).astype(np.int64)
+        if graph_ys
+        else np.array([], dtype=np.int64)
+      )
+      del graph_ys
+
+    return [
+      graph_ids[test]
+      for test in self.StratifiedTestIndices(graph_y, FLAGS.seed)
+    ]
 
-    splitter = model_selection.StratifiedKFold(
-      n_splits=self.k, shuffle=True, random_state=FLAGS.seed
-    )
-    dataset_splits = splitter.split(graph_ids, graph_y)
+  def StratifiedTestIndices(self, y: np.array, seed: int) -> List[np.array]:
+    """Compute the test indices of each fold of a stratified K-fold split.
+
+    This stratifies in the same manner as sklearn's StratifiedKFold, but runs
+    in O(N) and does not construct the train sets, which we do not need.
+
+    Args:
+      y: An array of integer class labels.
+      seed: The random seed used to shuffle the members of each class.
+
+    Returns:
+      A list of k arrays of indices into y, one per fold.
+    """
+    rand = np.random.RandomState(seed)
+    _, inverse = np.unique(y, return_inverse=True)
+
+    folds: List[List[np.array]] = [[] for _ in range(self.k)]
+    # Offset the fold assignment of each class by the running total of
+    # assigned indices so that the remainders of np.array_split() are spread
+    # evenly across folds, rather than always landing in the first folds.
+    offset = 0
+    for label in range(inverse.max() + 1 if len(inverse) else 0):
+      indices = np.where(inverse == label)[0]
+      rand.shuffle(indices)
+      for i, chunk in enumerate(np.array_split(indices, self.k)):
+        folds[(i + offset) % self.k].append(chunk)
+      offset += len(indices)
 
     return [
-      np.array(graph_ids[test], dtype=np.int32)
-      for i, (train, test) in enumerate(dataset_splits)
+      np.sort(np.concatenate(chunks))
+      if chunks
+      else np.array([], dtype=np.int64)
+      for chunks in folds
     ]
 
   def ApplySplit(self, db: graph_tuple_database.Database) -> None:
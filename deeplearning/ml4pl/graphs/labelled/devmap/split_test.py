@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/labelled/devmap:split."""
+import numpy as np
+
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.graphs.labelled.devmap import split
 from deeplearning.ml4pl.testing import random_graph_tuple_database_generator
@@ -52,6 +54,21 @@ def populated_graph_db(request) -> graph_tuple_database.Database:
     yield db
 
 
+@test.Parametrize("k", (3, 5))
+def test_StratifiedTestIndices_folds_are_stratified(k: int):
+  """Test that every index is assigned to exactly one balanced fold."""
+  y = np.array([0] * 53 + [1] * 17 + [2] * 3, dtype=np.int64)
+  folds = split.StratifiedGraphLabelKFold(k).StratifiedTestIndices(y, seed=0)
+
+  assert len(folds) == k
+  assert sorted(np.concatenate(folds).tolist()) == list(range(len(y)))
+  fold_sizes = [len(fold) for fold in folds]
+  assert max(fold_sizes) - min(fold_sizes) <= 1
+  for label in (0, 1):
+    label_counts = [np.sum(y[fold] == label) for fold in folds]
+    assert max(label_counts) - min(label_counts) <= 1
+
+
 @test.Parametrize("k", (3, 5))
 @decorators.loop_for(seconds=5, min_iteration_count=3)
 def test_fuzz(
@@ -60,7 +60,7 @@ def main():
           language=FLAGS.language,
           cflags=FLAGS.cflags,
           charcount=len(bytecode),
-          linecount=len(bytecode.split("\n")),
+          linecount=bytecode.count("\n") + 1,
           bytecode=bytecode,
           clang_returncode=0,
           error_message="",
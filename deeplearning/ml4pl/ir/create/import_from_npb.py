@@ -94,7 +94,7 @@ def ProcessBitcode(path: pathlib.Path) -> bytecode_database.LlvmBytecode:
     language="c",
     cflags=FLAGS.cflags,
     charcount=len(bytecode),
-    linecount=len(bytecode.split("\n")),
+    linecount=bytecode.count("\n") + 1,
     bytecode=bytecode,
     clang_returncode=0,
     error_message="",
@@ -14,8 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """This module exposes a function for generating batch iterators."""
+import functools
+from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Tuple
+
+import sqlalchemy as sql
 
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.models import batch as batches
@@ -47,6 +54,95 @@ app.DEFINE_integer(
   "Tuning parameter. The maximum number of batches to generate before waiting "
   "for the model to complete. Must be >= 1.",
 )
+app.DEFINE_integer(
+  "batch_reader_workers",
+  1,
+  "Tuning parameter. The number of threads used to read graphs and construct "
+  "batches. Each thread reads a disjoint shard of the graphs. Must be >= 1.",
+)
+
+
+@functools.lru_cache(maxsize=32)
+def _SplitFilter(splits: Tuple[int, ...]):
+  """Return a filter expression for graphs from the given splits.
+
+  Filter expressions are cached so that the same expression is reused across
+  epochs, rather than being rebuilt for every batch iterator.
+  """
+  if len(splits) == 1:
+    return graph_tuple_database.GraphTuple.split == splits[0]
+  else:
+    return graph_tuple_database.GraphTuple.split.in_(splits)
+
+
+def _GetShardFilters(
+  graph_db: graph_tuple_database.Database,
+  split_filter: Callable[[], Any],
+  shard_count: int,
+) -> List[Callable[[], Any]]:
+  """Return filters which divide the graphs into contiguous ranges of IDs.
+
+  Ranges of IDs, rather than e.g. the ID modulo the shard count, let each
+  shard's query use the primary key index.
+
+  Args:
+    graph_db: The graph database.
+    split_filter: A filter for the graphs to shard.
+    shard_count: The number of shards.
+
+  Returns:
+    A list of shard_count filters. The shards are disjoint, cover all of the
+    graphs, and contain near-equal numbers of graphs.
+  """
+  GraphTuple = graph_tuple_database.GraphTuple
+  with graph_db.Session() as session:
+    query = session.query(GraphTuple.id).filter(split_filter())
+    graph_count = query.count()
+    # The ID of the first graph in each shard after the first.
+    boundaries = []
+    for shard in range(1, shard_count):
+      row = (
+        query.order_by(GraphTuple.id)
+        .offset(shard * graph_count // shard_count)
+        .limit(1)
+        .first()
+      )
+      boundaries.append(row.id if row else None)
+
+  shard_filters = []
+  for shard in range(shard_count):
+    start_id = boundaries[shard - 1] if shard else None
+    end_id = boundaries[shard] if shard < len(boundaries) else None
+    if start_id is None and shard:
+      # Empty shard, which happens when there are fewer graphs than shards.
+      shard_filters.append(lambda: sql.false())
+    elif start_id is None and end_id is None:
+      shard_filters.append(lambda: sql.true())
+    elif start_id is None:
+      shard_filters.append(lambda end_id=end_id: GraphTuple.id < end_id)
+    elif end_id is None:
+      shard_filters.append(lambda start_id=start_id: GraphTuple.id >= start_id)
+    else:
+      shard_filters.append(
+        lambda start_id=start_id, end_id=end_id: sql.and_(
+          GraphTuple.id >= start_id, GraphTuple.id < end_id
+        )
+      )
+  return shard_filters
+
+
+def _RoundRobin(iterators: List[Iterable[Any]]) -> Iterable[Any]:
+  """Interleave the elements of multiple iterators until all are exhausted."""
+  iterators = [iter(iterator) for iterator in iterators]
+  while iterators:
+    active_iterators = []
+    for iterator in iterators:
+      try:
+        yield next(iterator)
+        active_iterators.append(iterator)
+      except StopIteration:
+        pass
+    iterators = active_iterators
 
 
 def MakeBatchIterator(
@@ -79,33 +175,62 @@ def MakeBatchIterator(
 
   splits_for_type = splits[epoch_type]
   ctx.Log(
-    3,
-    "Using %s graph splits %s",
-    epoch_type.name.lower(),
-    sorted(splits_for_type),
+    3, "Using %s graph splits %s", epoch_type.name.lower(), splits_for_type,
   )
 
-  if len(splits_for_type) == 1:
-    split_filter = (
-      lambda: graph_tuple_database.GraphTuple.split == splits_for_type[0]
+  splits_tuple = tuple(splits_for_type)
+  split_filter = lambda: _SplitFilter(splits_tuple)
+
+  worker_count = FLAGS.batch_reader_workers
+  if worker_count < 1:
+    raise app.UsageError("--batch_reader_workers must be >= 1")
+  # Every reader must have a limit of at least one graph, since a limit of
+  # zero means no limit.
+  if limit:
+    worker_count = min(worker_count, limit)
+
+  if worker_count == 1:
+    graph_reader = model.GraphReader(
+      epoch_type=epoch_type,
+      graph_db=graph_db,
+      filters=[split_filter],
+      limit=limit,
+      ctx=ctx,
     )
-  else:
-    split_filter = lambda: graph_tuple_database.GraphTuple.split.in_(
-      splits_for_type
+
+    return batches.BatchIterator(
+      batches=ppar.ThreadedIterator(
+        model.BatchIterator(epoch_type, graph_reader, ctx=ctx),
+        max_queue_size=FLAGS.batch_queue_size,
+      ),
+      graph_count=graph_reader.n,
     )
 
-  graph_reader = model.GraphReader(
-    epoch_type=epoch_type,
-    graph_db=graph_db,
-    filters=[split_filter],
-    limit=limit,
-    ctx=ctx,
-  )
+  # Read and batch disjoint shards of the graphs in parallel threads, and
+  # interleave the batches that they produce.
+  graph_readers = []
+  for shard, shard_filter in enumerate(
+    _GetShardFilters(graph_db, split_filter, worker_count)
+  ):
+    graph_readers.append(
+      model.GraphReader(
+        epoch_type=epoch_type,
+        graph_db=graph_db,
+        filters=[split_filter, shard_filter],
+        limit=None if limit is None else (limit + shard) // worker_count,
+        ctx=ctx,
+      )
+    )
 
   return batches.BatchIterator(
-    batches=ppar.ThreadedIterator(
-      model.BatchIterator(epoch_type, graph_reader, ctx=ctx),
-      max_queue_size=FLAGS.batch_queue_size,
+    batches=_RoundRobin(
+      [
+        ppar.ThreadedIterator(
+          model.BatchIterator(epoch_type, graph_reader, ctx=ctx),
+          max_queue_size=max(FLAGS.batch_queue_size // worker_count, 1),
+        )
+        for graph_reader in graph_readers
+      ]
     ),
-    graph_count=graph_reader.n,
+    graph_count=sum(graph_reader.n for graph_reader in graph_readers),
   )
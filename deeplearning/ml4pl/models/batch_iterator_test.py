@@ -0,0 +1,179 @@
+# Copyright 2019-2020 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/models:batch_iterator."""
+from typing import Iterable
+from typing import List
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.models import batch as batches
+from deeplearning.ml4pl.models import batch_iterator
+from deeplearning.ml4pl.models import classifier_base
+from deeplearning.ml4pl.models import epoch
+from deeplearning.ml4pl.models import log_database
+from deeplearning.ml4pl.models import logger as logging
+from deeplearning.ml4pl.testing import random_graph_tuple_database_generator
+from deeplearning.ml4pl.testing import testing_databases
+from labm8.py import progress
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+SPLITS = {
+  epoch.Type.TRAIN: [0],
+  epoch.Type.VAL: [1],
+  epoch.Type.TEST: [2],
+}
+
+
+@test.Fixture(
+  scope="session",
+  params=testing_databases.GetDatabaseUrls(),
+  namer=testing_databases.DatabaseUrlNamer("log_db"),
+)
+def log_db(request) -> log_database.Database:
+  """A test fixture which yields an empty log database."""
+  yield from testing_databases.YieldDatabase(
+    log_database.Database, request.param
+  )
+
+
+@test.Fixture(scope="session")
+def logger(log_db: log_database.Database) -> logging.Logger:
+  """A test fixture which yields a logger."""
+  with logging.Logger(log_db) as logger:
+    yield logger
+
+
+@test.Fixture(
+  scope="session",
+  params=testing_databases.GetDatabaseUrls(),
+  namer=testing_databases.DatabaseUrlNamer("graph_db"),
+)
+def graph_db(request) -> graph_tuple_database.Database:
+  """A test fixture which yields a graph database with three splits."""
+  with testing_databases.DatabaseContext(
+    graph_tuple_database.Database, request.param
+  ) as db:
+    random_graph_tuple_database_generator.PopulateDatabaseWithRandomGraphTuples(
+      db,
+      graph_count=100,
+      node_x_dimensionality=2,
+      node_y_dimensionality=2,
+      split_count=3,
+    )
+    yield db
+
+
+class MockModel(classifier_base.ClassifierBase):
+  """A mock model which batches graph IDs."""
+
+  def MakeBatch(
+    self,
+    epoch_type: epoch.Type,
+    graphs: Iterable[graph_tuple_database.GraphTuple],
+    ctx: progress.ProgressContext = progress.NullContext,
+  ) -> batches.Data:
+    """Generate a batch of up to 10 graph IDs."""
+    del epoch_type  # Unused.
+    del ctx  # Unused.
+
+    graph_ids = []
+    while len(graph_ids) < 10:
+      try:
+        graph_ids.append(next(graphs).id)
+      except StopIteration:
+        if len(graph_ids) == 0:
+          return batches.EndOfBatches()
+        break
+
+    return batches.Data(graph_ids=graph_ids, data=None)
+
+
+@test.Fixture(scope="function")
+def model(
+  logger: logging.Logger, graph_db: graph_tuple_database.Database
+) -> MockModel:
+  """A test fixture which yields a mock model."""
+  return MockModel(logger=logger, graph_db=graph_db)
+
+
+def GetTrainGraphIds(graph_db: graph_tuple_database.Database) -> List[int]:
+  """Return the IDs of all graphs in the training split."""
+  with graph_db.Session() as session:
+    return [
+      row.id
+      for row in session.query(graph_tuple_database.GraphTuple.id).filter(
+        graph_tuple_database.GraphTuple.split.in_(SPLITS[epoch.Type.TRAIN])
+      )
+    ]
+
+
+def GetBatchedGraphIds(iterator: batches.BatchIterator) -> List[int]:
+  """Return the graph IDs of every batch produced by an iterator."""
+  return [
+    graph_id for batch in iterator.batches for graph_id in batch.graph_ids
+  ]
+
+
+@test.Parametrize("worker_count", (1, 2, 4))
+def test_MakeBatchIterator_reads_every_graph_once(
+  model: MockModel, graph_db: graph_tuple_database.Database, worker_count: int
+):
+  """Test that sharded readers produce every graph exactly once."""
+  FLAGS.batch_reader_workers = worker_count
+  FLAGS.max_train_per_epoch = None
+
+  iterator = batch_iterator.MakeBatchIterator(
+    model=model,
+    graph_db=graph_db,
+    splits=SPLITS,
+    epoch_type=epoch.Type.TRAIN,
+  )
+  graph_ids = GetBatchedGraphIds(iterator)
+
+  assert sorted(graph_ids) == sorted(GetTrainGraphIds(graph_db))
+  assert iterator.graph_count == len(graph_ids)
+
+
+@test.Parametrize("worker_count", (1, 2, 4))
+@test.Parametrize("limit", (1, 3, 10))
+def test_MakeBatchIterator_limit(
+  model: MockModel,
+  graph_db: graph_tuple_database.Database,
+  worker_count: int,
+  limit: int,
+):
+  """Test that the limit is enforced, including limits < worker count."""
+  FLAGS.batch_reader_workers = worker_count
+  FLAGS.max_train_per_epoch = limit
+
+  iterator = batch_iterator.MakeBatchIterator(
+    model=model,
+    graph_db=graph_db,
+    splits=SPLITS,
+    epoch_type=epoch.Type.TRAIN,
+  )
+  graph_ids = GetBatchedGraphIds(iterator)
+
+  expected_count = min(limit, len(GetTrainGraphIds(graph_db)))
+  assert len(graph_ids) == expected_count
+  assert len(set(graph_ids)) == expected_count
+  assert iterator.graph_count == expected_count
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -86,31 +86,26 @@ class CheckpointReference(NamedTuple):
     Raises:
       ValueError: If the string is malformed.
     """
-    try:
-      if "@" in string:
-        components = string.split("@")
-        assert len(components) == 2
-        run_id_or_tag, epoch_num_string = components
-        if epoch_num_string == "best":
-          epoch_num = None
-        else:
-          epoch_num = int(epoch_num_string)
-      else:
-        run_id_or_tag = string
-        epoch_num = None
-
-      # Try to construct a run ID by parsing the string. If this fails, assume
-      # it is a tag.
+    run_id_or_tag, separator, epoch_num_string = string.partition("@")
+    # Omitting the "@<epoch_num>" suffix is the same as "@best".
+    if not separator or epoch_num_string == "best":
+      epoch_num = None
+    else:
       try:
-        run_id = run_id_lib.RunId.FromString(run_id_or_tag)
-        tag = None
+        epoch_num = int(epoch_num_string)
       except ValueError:
-        run_id = None
-        tag = run_id_or_tag
+        raise ValueError(f"Invalid checkpoint format: {string}")
+
+    # Try to construct a run ID by parsing the string. If this fails, assume
+    # it is a tag.
+    try:
+      run_id = run_id_lib.RunId.FromString(run_id_or_tag)
+      tag = None
+    except ValueError:
+      run_id = None
+      tag = run_id_or_tag
 
-      return CheckpointReference(run_id, tag, epoch_num)
-    except Exception:
-      raise ValueError(f"Invalid checkpoint format: {string}")
+    return CheckpointReference(run_id, tag, epoch_num)
 
 
 class Checkpoint(NamedTuple):
@@ -43,6 +43,14 @@ def CheckpointReference_from_tag_with_best_epoch_num():
   assert c.epoch_num is None
 
 
+def test_CheckpointReference_from_malformed_string():
+  """Test that malformed epoch numbers are rejected."""
+  for string in ["my_tag@", "my_tag@foo", "my_tag@1@2"]:
+    with test.Raises(ValueError) as e_ctx:
+      checkpoints.CheckpointReference.FromString(string)
+    assert str(e_ctx.value) == f"Invalid checkpoint format: {string}"
+
+
 def CheckpointReference_without_epoch_num():
   """Check construction of a checkpoint reference without epoch number."""
   run_id = run_id_lib.RunId.GenerateUnique("reftest")
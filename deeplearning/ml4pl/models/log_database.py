@@ -475,7 +475,12 @@ class Checkpoint(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
       run_id=str(checkpoint.run_id),
       epoch_num=checkpoint.epoch_num,
       data=CheckpointModelData(
-        binary_data=codecs.encode(pickle.dumps(checkpoint.model_data), "zlib")
+        binary_data=codecs.encode(
+          pickle.dumps(
+            checkpoint.model_data, protocol=pickle.HIGHEST_PROTOCOL
+          ),
+          "zlib",
+        )
       ),
     )
 
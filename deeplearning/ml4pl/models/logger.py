@@ -17,7 +17,6 @@
 from typing import Optional
 
 import pandas as pd
-import sqlalchemy as sql
 
 from deeplearning.ml4pl import run_id as run_id_lib
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
@@ -148,6 +147,10 @@ class Logger(object):
       log_level=log_level,
     )
 
+    # Read the schedules for rotating logs once, rather than on every event.
+    self.keep_checkpoints = FLAGS.keep_checkpoints()
+    self.keep_detailed_batches = FLAGS.keep_detailed_batches()
+
     # Build a set of epoch types to keep detailed batches for.
     self.detailed_batch_epoch_types = set()
     for detailed_batch_type in FLAGS.detailed_batch_types:
@@ -275,7 +278,7 @@ class Logger(object):
     del epoch_type
     del results
 
-    schedule = FLAGS.keep_detailed_batches()
+    schedule = self.keep_detailed_batches
 
     if schedule == schedules.KeepDetailedBatches.NONE:
       pass
@@ -285,21 +288,20 @@ class Logger(object):
 
       def DeleteOldDetailedBatchLogs(session):
         """Delete old detailed batch logs."""
-        detailed_batches_to_delete = [
-          row.id
-          for row in session.query(log_database.Batch.id).filter(
-            log_database.Batch.run_id == run_id,
-            log_database.Batch.epoch_num != epoch_num,
-          )
-        ]
-        if detailed_batches_to_delete:
-          session.query(log_database.BatchDetails).filter(
-            log_database.BatchDetails.id.in_(detailed_batches_to_delete)
-          ).delete(synchronize_session=False)
+        # Select the batches to delete using a subquery, rather than reading
+        # their IDs back and sending them in a (potentially huge) IN list.
+        old_batches = session.query(log_database.Batch.id).filter(
+          log_database.Batch.run_id == run_id,
+          log_database.Batch.epoch_num != epoch_num,
+        )
+        deleted_count = (
+          session.query(log_database.BatchDetails)
+          .filter(log_database.BatchDetails.id.in_(old_batches.subquery()))
+          .delete(synchronize_session=False)
+        )
+        if deleted_count:
           self.ctx.Log(
-            2,
-            "Deleted %s old batch log details",
-            len(detailed_batches_to_delete),
+            2, "Deleted %s old batch log details", deleted_count,
           )
 
       self._writer.AddLambdaOp(DeleteOldDetailedBatchLogs)
@@ -317,24 +319,39 @@ class Logger(object):
     Args:
       checkpoint: A model checkpoint, as generated by model.GetCheckpoint().
     """
-    keep_schedule = FLAGS.keep_checkpoints()
+    keep_schedule = self.keep_checkpoints
 
     checkpoint = log_database.Checkpoint.Create(checkpoint)
+    run_id, epoch_num = checkpoint.run_id, checkpoint.epoch_num
 
-    # Delete old checkpoints if required.
+    # Delete old checkpoints if required. The checkpoints of other epochs are
+    # deleted after writing the new checkpoint so that a run always has a
+    # checkpoint in the database.
     if keep_schedule == schedules.KeepCheckpoints.ALL:
-      pass
+      self._writer.AddOne(checkpoint)
     elif keep_schedule == schedules.KeepCheckpoints.LAST:
+      # Replace any existing checkpoint of the same epoch, which would
+      # otherwise violate the unique (run_id, epoch_num) constraint.
+      self._writer.AddLambdaOp(
+        lambda session: session.query(log_database.Checkpoint)
+        .filter(
+          log_database.Checkpoint.run_id == run_id,
+          log_database.Checkpoint.epoch_num == epoch_num,
+        )
+        .delete(synchronize_session=False)
+      )
+      self._writer.AddOne(checkpoint)
       self._writer.AddLambdaOp(
         lambda session: session.query(log_database.Checkpoint)
-        .filter(log_database.Checkpoint.run_id == checkpoint.run_id)
-        .delete()
+        .filter(
+          log_database.Checkpoint.run_id == run_id,
+          log_database.Checkpoint.epoch_num != epoch_num,
+        )
+        .delete(synchronize_session=False)
       )
     else:
       raise NotImplementedError("unreachable")
 
-    self._writer.AddOne(checkpoint)
-
   def Load(
     self, checkpoint_ref: checkpoints.CheckpointReference
   ) -> checkpoints.Checkpoint:
@@ -396,7 +413,6 @@ class Logger(object):
           log_database.Checkpoint.run_id.in_(str(s) for s in run_ids),
           log_database.Checkpoint.epoch_num == int(epoch_num),
         )
-        .options(sql.orm.joinedload(log_database.Checkpoint.data))
         .first()
       )
       # Check that the requested checkpoint exists.
@@ -413,12 +429,17 @@ class Logger(object):
           f"Available checkpoints: {available_checkpoints}"
         )
 
+      best_results = self.db.GetBestResults(
+        run_id=checkpoint_entry.run_id, session=session
+      )
+
+      # The model data is the largest part of a checkpoint by far, so it is
+      # loaded last, rather than joined to the checkpoint query, so that it is
+      # not held in memory while the best results are computed.
       checkpoint = checkpoints.Checkpoint(
         run_id=run_id_lib.RunId.FromString(checkpoint_entry.run_id),
         epoch_num=checkpoint_entry.epoch_num,
-        best_results=self.db.GetBestResults(
-          run_id=checkpoint_entry.run_id, session=session
-        ),
+        best_results=best_results,
         model_data=checkpoint_entry.model_data,
       )
 
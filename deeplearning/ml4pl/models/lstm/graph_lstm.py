@@ -218,28 +218,24 @@ class GraphLstm(lstm_base.LstmBase):
     if not graphs:
       return batches.EndOfBatches()
 
-    # Encode the graphs in the batch.
-    encoded_sequences: List[np.array] = self.encoder.Encode(graphs, ctx=ctx)
+    # Encode the graphs in the batch, padding and truncating the encoded
+    # sequences.
+    encoded_sequences: np.array = self.encoder.EncodeAndPad(
+      graphs,
+      padded_length=self.padded_sequence_length,
+      padding_element=self.padding_element,
+      ctx=ctx,
+    )
     graph_x: List[np.array] = []
     graph_y: List[np.array] = []
     for graph in graphs:
       graph_x.append(graph.tuple.graph_x)
       graph_y.append(graph.tuple.graph_y)
 
-    # Pad and truncate encoded sequences.
-    encoded_sequences = tf.compat.v1.keras.preprocessing.sequence.pad_sequences(
-      encoded_sequences,
-      maxlen=self.padded_sequence_length,
-      dtype="int32",
-      padding="pre",
-      truncating="post",
-      value=self.padding_element,
-    )
-
     return batches.Data(
       graph_ids=[graph.id for graph in graphs],
       data=GraphLstmBatch(
-        encoded_sequences=np.vstack(encoded_sequences),
+        encoded_sequences=encoded_sequences,
         graph_x=np.vstack(graph_x),
         graph_y=np.vstack(graph_y),
       ),
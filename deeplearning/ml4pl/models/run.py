@@ -163,9 +163,16 @@ def SplitStringsToInts(split_strings: List[str]):
 def SplitsFromFlags(
   graph_db: graph_tuple_database.Database,
 ) -> Dict[epoch.Type, List[int]]:
+  """Determine the splits to use for each epoch type.
+
+  This is computed once per run, not once per epoch, since the splits cannot
+  change during a run.
+  """
   val_splits = SplitStringsToInts(FLAGS.val_split)
   test_splits = SplitStringsToInts(FLAGS.test_split)
-  train_splits = list(set(graph_db.splits) - set(val_splits) - set(test_splits))
+  train_splits = sorted(
+    set(graph_db.splits) - set(val_splits) - set(test_splits)
+  )
   return {
     epoch.Type.TRAIN: train_splits,
     epoch.Type.VAL: val_splits,
@@ -239,6 +246,9 @@ class TrainValTestLoop(progress.Progress):
     self.graph_db = graph_db
     self.logger = logger
     self.splits = splits
+    # The training batches for the next epoch, if they have been created ahead
+    # of time.
+    self._next_train_batches: Optional[batchs.BatchIterator] = None
     super(TrainValTestLoop, self).__init__(
       name=GetRunNamePrefix(self.model),
       i=self.model.epoch_num,
@@ -281,14 +291,18 @@ class TrainValTestLoop(progress.Progress):
       ctx=self.ctx,
     )
 
-  def RunOneEpoch(self, test_on: str, save_on) -> epoch.Results:
-    """Inner loop to run a single train/val/test epoch and return the
-    validation score.
+  def RunOneEpoch(self, test_on: str, save_on) -> bool:
+    """Inner loop to run a single train/val/test epoch and return whether to
+    stop early.
     """
     # Create both training and validation batch iterators ahead of time to start
-    # asynchronously constructing batches. The testing iterator must be produced
-    # on demand as it isn't always needed.
-    train_batches = self.MakeBatchIterator(epoch.Type.TRAIN)
+    # asynchronously constructing batches. The training iterator may already
+    # have been created during the previous epoch. The testing iterator must be
+    # produced on demand as it isn't always needed.
+    train_batches = self._next_train_batches or self.MakeBatchIterator(
+      epoch.Type.TRAIN
+    )
+    self._next_train_batches = None
     val_batches = self.MakeBatchIterator(epoch.Type.VAL)
     if test_on == "every":
       # If we know that we're going to use them, produce the test batches.
@@ -298,6 +312,14 @@ class TrainValTestLoop(progress.Progress):
     train_results, _ = self.RunEpoch(epoch.Type.TRAIN, train_batches)
     val_results, val_improved = self.RunEpoch(epoch.Type.VAL, val_batches)
 
+    # If the next epoch is expected to run, create its training batches now so
+    # that they are read while this epoch is tested and checkpointed. The
+    # validation-based stopping conditions cannot change after this point, but
+    # the time limit is checked again below.
+    exit_early = self.ShouldExitEarly(val_results)
+    if not exit_early and self.ctx.i < self.ctx.n - 1:
+      self._next_train_batches = self.MakeBatchIterator(epoch.Type.TRAIN)
+
     if test_on == "improvement" and self.ctx.i == 0:
       # We always test on the first epoch when "improvement" is set, even if
       # there wasn't an improvement. Otherwise, a model would never be tested
@@ -321,13 +343,29 @@ class TrainValTestLoop(progress.Progress):
     if test_on == "every":
       self.RunEpoch(epoch.Type.TEST, test_batches)
 
-    return val_results
+    # Check the time limit again now that testing and checkpointing are done.
+    if not exit_early and self.TimeLimitReached():
+      exit_early = True
+      if self._next_train_batches:
+        # A batch iterator's reader thread blocks until its batches are
+        # consumed, so drain the unused training batches to let it finish.
+        for _ in self._next_train_batches.batches:
+          pass
+        self._next_train_batches = None
 
-  def ShouldExitEarly(self, val_results: epoch.Results) -> bool:
-    """Determine whether to stop early."""
+    return exit_early
+
+  def TimeLimitReached(self) -> bool:
+    """Determine whether the --stop_at time limit has been reached."""
     if self.end_time and time.time() > self.end_time:
       app.Log(1, "Stopping after reaching time limit")
       return True
+    return False
+
+  def ShouldExitEarly(self, val_results: epoch.Results) -> bool:
+    """Determine whether to stop early."""
+    if self.TimeLimitReached():
+      return True
 
     if self.min_val_acc and val_results.accuracy >= self.min_val_acc:
       app.Log(
@@ -357,14 +395,13 @@ class TrainValTestLoop(progress.Progress):
 
     # Run the train/val/test loop.
     for self.ctx.i in range(self.ctx.i, self.ctx.n):
-      val_results = self.RunOneEpoch(test_on, save_on)
-      if self.ShouldExitEarly(val_results):
+      if self.RunOneEpoch(test_on, save_on):
         break
 
     # Record the final epoch.
     self.ctx.i = self.ctx.n
 
-    if FLAGS.test_on == "best":
+    if test_on == "best":
       # If training on the best result, restore the model to the state of the
       # best epoch.
 
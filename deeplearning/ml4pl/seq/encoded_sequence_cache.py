@@ -0,0 +1,141 @@
+# Copyright 2019-2020 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A database for persisting the encoded sequences of graph2seq encoders.
+
+This is used as a second-level cache behind an encoder's in-memory cache, so
+that sequences which are evicted from memory, or which were encoded by an
+earlier process, need not be encoded again.
+"""
+import codecs
+import hashlib
+import json
+import pickle
+from typing import Any
+from typing import Dict
+from typing import List
+
+import sqlalchemy as sql
+from sqlalchemy.ext import declarative
+
+from labm8.py import labtypes
+from labm8.py import sqlutil
+
+
+Base = declarative.declarative_base()
+
+
+class EncodedSequence(
+  Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin
+):
+  """An encoded sequence."""
+
+  # The name of the encoder which produced the sequence. Sequences produced by
+  # encoders with different configurations are not interchangeable.
+  encoder: str = sql.Column(sql.String(128), primary_key=True)
+
+  ir_id: int = sql.Column(sql.Integer, primary_key=True)
+
+  # The zlib-compressed pickled sequence.
+  binary_encoded: bytes = sql.Column(
+    sqlutil.ColumnTypes.LargeBinary(), nullable=False
+  )
+
+  @classmethod
+  def Create(cls, encoder: str, ir_id: int, encoded: Any):
+    """Instantiate an encoded sequence. Use this convenience method rather than
+    constructing objects directly to ensure that fields are encoded correctly.
+    """
+    return cls(
+      encoder=encoder,
+      ir_id=ir_id,
+      binary_encoded=codecs.encode(
+        pickle.dumps(encoded, protocol=pickle.HIGHEST_PROTOCOL), "zlib"
+      ),
+    )
+
+
+class Database(sqlutil.Database):
+  """A database of encoded sequences."""
+
+  def __init__(self, url: str, must_exist: bool = False):
+    super(Database, self).__init__(url, Base, must_exist=must_exist)
+
+  def Get(
+    self, encoder: str, ir_ids: List[int], max_ids_per_query: int = 500
+  ) -> Dict[int, Any]:
+    """Look up the encoded sequences of the given IR IDs.
+
+    Args:
+      encoder: The name of the encoder.
+      ir_ids: The IR IDs to look up.
+      max_ids_per_query: The maximum number of IDs to look up in one query.
+
+    Returns:
+      A mapping from IR ID to encoded sequence for the IDs which are found.
+    """
+    with self.Session() as session:
+      return {
+        row.ir_id: pickle.loads(codecs.decode(row.binary_encoded, "zlib"))
+        for chunk in labtypes.Chunkify(ir_ids, max_ids_per_query)
+        for row in session.query(
+          EncodedSequence.ir_id, EncodedSequence.binary_encoded
+        ).filter(
+          EncodedSequence.encoder == encoder, EncodedSequence.ir_id.in_(chunk),
+        )
+      }
+
+  def Put(
+    self,
+    encoder: str,
+    ir_id_to_encoded: Dict[int, Any],
+    max_ids_per_query: int = 500,
+  ) -> None:
+    """Store encoded sequences, replacing any existing sequences.
+
+    Args:
+      encoder: The name of the encoder.
+      ir_id_to_encoded: A mapping from IR ID to encoded sequence.
+      max_ids_per_query: The maximum number of IDs to delete in one query.
+    """
+    with self.Session(commit=True) as session:
+      # Delete the existing rows and insert the new rows in bulk, rather than
+      # merging each row, which requires a SELECT per row.
+      for chunk in labtypes.Chunkify(
+        list(ir_id_to_encoded.keys()), max_ids_per_query
+      ):
+        session.query(EncodedSequence).filter(
+          EncodedSequence.encoder == encoder, EncodedSequence.ir_id.in_(chunk),
+        ).delete(synchronize_session=False)
+      session.bulk_save_objects(
+        [
+          EncodedSequence.Create(encoder, ir_id, encoded)
+          for ir_id, encoded in ir_id_to_encoded.items()
+        ]
+      )
+
+
+def VocabularyHash(vocabulary: Dict[str, int]) -> str:
+  """Return a hash of a vocabulary, for use in encoder names.
+
+  Args:
+    vocabulary: A mapping from vocabulary element to index.
+
+  Returns:
+    A hex digest of the vocabulary.
+  """
+  return hashlib.sha1(
+    json.dumps(vocabulary, sort_keys=True).encode("utf-8")
+  ).hexdigest()
@@ -0,0 +1,82 @@
+# Copyright 2019-2020 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/seq:encoded_sequence_cache."""
+import pathlib
+
+import numpy as np
+
+from deeplearning.ml4pl.seq import encoded_sequence_cache
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+
+@test.Fixture(scope="function")
+def db(tempdir: pathlib.Path) -> encoded_sequence_cache.Database:
+  """A test fixture which yields an empty database."""
+  yield encoded_sequence_cache.Database(f"sqlite:///{tempdir}/db")
+
+
+def test_Database_Get_empty(db: encoded_sequence_cache.Database):
+  """Test that nothing is found in an empty database."""
+  assert db.Get("encoder", [1, 2, 3]) == {}
+
+
+def test_Database_Put_Get_round_trip(db: encoded_sequence_cache.Database):
+  """Test that stored sequences are returned."""
+  db.Put(
+    "encoder",
+    {1: np.array([1, 2, 3], dtype=np.int32), 2: np.array([], dtype=np.int32)},
+  )
+  found = db.Get("encoder", [1, 2, 3], max_ids_per_query=1)
+  assert sorted(found.keys()) == [1, 2]
+  assert found[1].tolist() == [1, 2, 3]
+  assert found[1].dtype == np.int32
+  assert found[2].tolist() == []
+
+
+def test_Database_Put_overwrites(db: encoded_sequence_cache.Database):
+  """Test that storing a sequence twice replaces the old value."""
+  db.Put("encoder", {1: np.array([1, 2, 3])})
+  db.Put("encoder", {1: np.array([4, 5])})
+  assert db.Get("encoder", [1])[1].tolist() == [4, 5]
+
+
+def test_Database_Get_separates_encoders(db: encoded_sequence_cache.Database):
+  """Test that sequences of one encoder are not returned for another."""
+  db.Put("a", {1: np.array([1])})
+  db.Put("b", {2: np.array([2])})
+  assert list(db.Get("a", [1, 2]).keys()) == [1]
+  assert list(db.Get("b", [1, 2]).keys()) == [2]
+
+
+def test_VocabularyHash_is_order_independent():
+  """Test that the hash does not depend on the order of elements."""
+  assert encoded_sequence_cache.VocabularyHash(
+    {"a": 0, "b": 1}
+  ) == encoded_sequence_cache.VocabularyHash({"b": 1, "a": 0})
+
+
+def test_VocabularyHash_differs_between_vocabularies():
+  """Test that different vocabularies have different hashes."""
+  assert encoded_sequence_cache.VocabularyHash(
+    {"a": 0, "b": 1}
+  ) != encoded_sequence_cache.VocabularyHash({"a": 1, "b": 0})
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -14,11 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Module for conversion from unlabelled graphs to encoded sequences."""
-import json
+import collections
+import math
 import subprocess
+from concurrent import futures
+from typing import Any
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 from typing import Union
 
 import lru
@@ -28,11 +32,13 @@ import sqlalchemy as sql
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
+from deeplearning.ml4pl.seq import encoded_sequence_cache
 from deeplearning.ml4pl.seq import graph2seq_pb2
 from deeplearning.ml4pl.seq import ir2seq
 from labm8.py import app
 from labm8.py import bazelutil
 from labm8.py import humanize
+from labm8.py import labtypes
 from labm8.py import pbutil
 from labm8.py import progress
 
@@ -44,6 +50,43 @@ app.DEFINE_integer(
   10000,
   "The number of ID -> encoded sequence entries to cache.",
 )
+app.DEFINE_integer(
+  "graph2seq_batch_cache_entries",
+  0,
+  "The number of recent batches to remember the encoded sequences of, keyed by "
+  "the IR IDs of the batch's graphs. This avoids repeating the per-graph cache "
+  "lookups when the same batch is encoded repeatedly. Set to 0 to disable.",
+)
+app.DEFINE_boolean(
+  "graph2seq_cache_admission",
+  False,
+  "Only admit a newly encoded sequence to a full cache if its IR has been "
+  "requested more frequently than the least recently used entry. This "
+  "prevents the cache from thrashing when graphs are read in a cycle that is "
+  "larger than the cache, e.g. once per epoch.",
+)
+app.DEFINE_integer(
+  "graph2seq_encoder_parallelism",
+  1,
+  "The number of threads used by the graph-level encoder to encode a batch of "
+  "IRs. Each thread encodes a contiguous chunk of the batch. The IR encoders "
+  "spend most of their time in database queries and encoder subprocesses, "
+  "which run in parallel.",
+)
+app.DEFINE_database(
+  "graph2seq_disk_cache",
+  encoded_sequence_cache.Database,
+  None,
+  "An optional database of encoded sequences to use as a second-level cache "
+  "behind the in-memory cache. Encoded sequences are stored per encoder "
+  "configuration and vocabulary.",
+)
+app.DEFINE_integer(
+  "graph2seq_max_ids_per_query",
+  500,
+  "Tuning parameter. The maximum number of IDs to look up in a single query "
+  "when fetching program graphs to encode.",
+)
 app.DEFINE_integer(
   "graph_encoder_timeout",
   120,
@@ -54,9 +97,66 @@ GRAPH_ENCODER_WORKER = bazelutil.DataPath(
   "phd/deeplearning/ml4pl/seq/graph_encoder_worker"
 )
 
-# The vocabulary to use for LLVM encoders. Use
-# //deeplearning/ml4pl/seq:derive_vocab to generate a vocabulary.
-LLVM_VOCAB = bazelutil.DataPath("phd/deeplearning/ml4pl/seq/llvm_vocab.json")
+
+class FrequencyAdmissionCache(object):
+  """A least-recently-used cache which gates insertion on access frequency.
+
+  Plain LRU caches perform badly when keys are accessed in a cycle which is
+  larger than the cache, since every key is evicted before it is used again.
+  This cache counts the accesses of every key, and once full, only admits a new
+  key if it has been accessed more often than the entry it would evict. The
+  counts are periodically halved so that they track recent frequency.
+  """
+
+  def __init__(self, size: int):
+    if size < 1:
+      raise ValueError(f"Cache size must be >= 1, not {size}")
+    self.size = size
+    self._entries: Dict[Any, Any] = collections.OrderedDict()
+    self._counts: Dict[Any, int] = collections.defaultdict(int)
+    self._access_count = 0
+
+  def _RecordAccess(self, key) -> None:
+    self._counts[key] += 1
+    self._access_count += 1
+    # Age the counts.
+    if self._access_count >= 10 * self.size:
+      self._counts = collections.defaultdict(
+        int,
+        {
+          key: count // 2
+          for key, count in self._counts.items()
+          if count // 2 or key in self._entries
+        },
+      )
+      self._access_count = 0
+
+  def get(self, key, default=None):
+    """Return the value for key, or default if the key is not cached."""
+    self._RecordAccess(key)
+    if key in self._entries:
+      self._entries.move_to_end(key)
+      return self._entries[key]
+    return default
+
+  def __setitem__(self, key, value) -> None:
+    if key in self._entries:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      return
+
+    if len(self._entries) >= self.size:
+      victim = next(iter(self._entries))
+      if self._counts[key] <= self._counts[victim]:
+        return
+      del self._entries[victim]
+    self._entries[key] = value
+
+  def __contains__(self, key) -> bool:
+    return key in self._entries
+
+  def __len__(self) -> int:
+    return len(self._entries)
 
 
 class EncoderBase(object):
@@ -72,7 +172,22 @@ class EncoderBase(object):
     # Maintain a mapping from IR IDs to encoded sequences to amortize the
     # cost of encoding.
     cache_size = cache_size or FLAGS.graph2seq_cache_entries
-    self.ir_id_to_encoded: Dict[int, np.array] = lru.LRU(cache_size)
+    if FLAGS.graph2seq_cache_admission:
+      self.ir_id_to_encoded = FrequencyAdmissionCache(cache_size)
+    else:
+      self.ir_id_to_encoded: Dict[int, np.array] = lru.LRU(cache_size)
+
+    # Optionally persist encoded sequences to a database.
+    self.disk_cache: Optional[encoded_sequence_cache.Database] = (
+      FLAGS.graph2seq_disk_cache() if FLAGS.graph2seq_disk_cache else None
+    )
+
+    # Optionally maintain a mapping from the IR IDs of recent batches to their
+    # encoded sequences.
+    batch_cache_size = FLAGS.graph2seq_batch_cache_entries
+    self.ir_ids_to_encoded_batch: Optional[Dict[Tuple[int, ...], Any]] = (
+      lru.LRU(batch_cache_size) if batch_cache_size else None
+    )
 
   def Encode(
     self,
@@ -80,12 +195,24 @@ class EncoderBase(object):
     ctx: progress.ProgressContext = progress.NullContext,
   ) -> List[Union[np.array, graph2seq_pb2.ProgramGraphSeq]]:
     """Translate a list of graphs to encoded sequences."""
+    if self.ir_ids_to_encoded_batch is not None:
+      batch_ir_ids = tuple(graph.ir_id for graph in graphs)
+      encoded_batch = self.ir_ids_to_encoded_batch.get(batch_ir_ids)
+      if encoded_batch is not None:
+        return list(encoded_batch)
+
     unique_ids = {graph.ir_id for graph in graphs}
-    id_to_encoded = {
-      ir_id: self.ir_id_to_encoded[ir_id]
-      for ir_id in unique_ids
-      if ir_id in self.ir_id_to_encoded
-    }
+
+    # Partition the IDs into cached and unknown IDs in a single pass over the
+    # cache.
+    id_to_encoded = {}
+    unknown_ir_ids = []
+    for ir_id in unique_ids:
+      encoded = self.ir_id_to_encoded.get(ir_id)
+      if encoded is None:
+        unknown_ir_ids.append(ir_id)
+      else:
+        id_to_encoded[ir_id] = encoded
 
     ctx.Log(
       5,
@@ -93,26 +220,44 @@ class EncoderBase(object):
       (len(id_to_encoded) / len(unique_ids)) * 100,
     )
 
-    if len(id_to_encoded) != len(unique_ids):
-      unknown_ir_ids = {
-        ir_id for ir_id in unique_ids if ir_id not in id_to_encoded
-      }
+    if unknown_ir_ids and self.disk_cache:
+      # Look up the unknown IRs in the on-disk cache, and promote the sequences
+      # which are found to the in-memory cache.
+      for ir_id, encoded in self.disk_cache.Get(
+        self.name, unknown_ir_ids, FLAGS.graph2seq_max_ids_per_query
+      ).items():
+        id_to_encoded[ir_id] = encoded
+        self.ir_id_to_encoded[ir_id] = encoded
+      unknown_ir_ids = [
+        ir_id for ir_id in unknown_ir_ids if ir_id not in id_to_encoded
+      ]
 
-      # Encode the unknown IRs.
-      sorted_ir_ids_to_encode = sorted(unknown_ir_ids)
-      sorted_encoded_sequences = self.EncodeIds(sorted_ir_ids_to_encode, ctx)
+    if unknown_ir_ids:
+      # Encode the unknown IRs. EncodeIds() requires the IDs in sorted order.
+      # The list of unknown IDs is private to this call, so sort it in place.
+      unknown_ir_ids.sort()
+      sorted_encoded_sequences = self.EncodeIds(unknown_ir_ids, ctx)
 
       # Cache the recently encoded sequences. We must do this *after* fetching
       # from the cache to prevent the cached items from being evicted.
-      for ir_id, encoded in zip(
-        sorted_ir_ids_to_encode, sorted_encoded_sequences
-      ):
+      for ir_id, encoded in zip(unknown_ir_ids, sorted_encoded_sequences):
         id_to_encoded[ir_id] = encoded
         self.ir_id_to_encoded[ir_id] = encoded
 
+      if self.disk_cache:
+        self.disk_cache.Put(
+          self.name,
+          dict(zip(unknown_ir_ids, sorted_encoded_sequences)),
+          FLAGS.graph2seq_max_ids_per_query,
+        )
+
     # Assemble the list of encoded graphs.
     encoded = [id_to_encoded[graph.ir_id] for graph in graphs]
 
+    if self.ir_ids_to_encoded_batch is not None:
+      # Store an immutable copy so that callers cannot modify the cached batch.
+      self.ir_ids_to_encoded_batch[batch_ir_ids] = tuple(encoded)
+
     return encoded
 
   def EncodeIds(
@@ -121,6 +266,14 @@ class EncoderBase(object):
     """Encode a list of graph IDs and return the sequences in the same order."""
     raise NotImplementedError("abstract class")
 
+  @property
+  def name(self) -> str:
+    """Return a name which identifies the configuration of the encoder.
+
+    Encoders with the same name must produce the same encoded sequences.
+    """
+    return type(self).__name__
+
   @property
   def max_encoded_length(self) -> int:
     """Return an upper bound on the length of the encoded sequences."""
@@ -147,6 +300,8 @@ class GraphEncoder(EncoderBase):
   ):
     super(GraphEncoder, self).__init__(graph_db, cache_size)
     self.ir2seq_encoder = ir2seq_encoder
+    # Set on the first access of the name property.
+    self._name: Optional[str] = None
 
   @property
   def max_encoded_length(self) -> int:
@@ -158,6 +313,51 @@ class GraphEncoder(EncoderBase):
     """Get the size of the vocabulary, including the unknown-vocab element."""
     return self.ir2seq_encoder.vocabulary_size
 
+  @property
+  def name(self) -> str:
+    """Return a name which identifies the configuration of the encoder."""
+    if self._name is None:
+      vocabulary_hash = encoded_sequence_cache.VocabularyHash(
+        self.ir2seq_encoder.vocabulary
+      )
+      self._name = (
+        f"{type(self).__name__}:{type(self.ir2seq_encoder).__name__}:"
+        f"{vocabulary_hash}"
+      )
+    return self._name
+
+  def EncodeAndPad(
+    self,
+    graphs: List[graph_tuple_database.GraphTuple],
+    padded_length: int,
+    padding_element: int,
+    ctx: progress.ProgressContext = progress.NullContext,
+  ) -> np.array:
+    """Translate a list of graphs to a matrix of padded encoded sequences.
+
+    Sequences longer than padded_length are truncated at the end, and shorter
+    sequences are padded at the start. This produces the same result as keras'
+    pad_sequences(padding="pre", truncating="post"), but copies each sequence
+    directly into a preallocated matrix.
+
+    Args:
+      graphs: The graphs to encode.
+      padded_length: The length of the padded sequences.
+      padding_element: The value to pad sequences with.
+      ctx: A logging context.
+
+    Returns:
+      An array of shape (len(graphs), padded_length) of dtype np.int32.
+    """
+    padded = np.full(
+      (len(graphs), padded_length), padding_element, dtype=np.int32
+    )
+    for row, encoded in zip(padded, self.Encode(graphs, ctx=ctx)):
+      encoded = encoded[:padded_length]
+      if len(encoded):
+        row[-len(encoded) :] = encoded
+    return padded
+
   def EncodeIds(
     self, ir_ids: List[int], ctx: progress.ProgressContext
   ) -> List[np.array]:
@@ -174,7 +374,29 @@ class GraphEncoder(EncoderBase):
     Returns:
       A list of encoded sequences.
     """
-    return self.ir2seq_encoder.Encode(ir_ids, ctx=ctx)
+    parallelism = FLAGS.graph2seq_encoder_parallelism
+    if parallelism <= 1 or len(ir_ids) <= 1:
+      encodeds = self.ir2seq_encoder.Encode(ir_ids, ctx=ctx)
+    else:
+      # Encode contiguous chunks of the IDs in parallel and concatenate the
+      # results, which preserves the order of the IDs.
+      chunks = list(
+        labtypes.Chunkify(ir_ids, math.ceil(len(ir_ids) / parallelism))
+      )
+      with futures.ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        encoded_chunks = executor.map(
+          lambda chunk: self.ir2seq_encoder.Encode(chunk, ctx=ctx), chunks
+        )
+        encodeds = [encoded for chunk in encoded_chunks for encoded in chunk]
+
+    # The encoded sequences are cached, so store them using the smallest type
+    # which can represent every vocabulary element, including the unknown
+    # element, to fit more sequences in the cache.
+    if self.vocabulary_size < np.iinfo(np.int16).max:
+      dtype = np.int16
+    else:
+      dtype = np.int32
+    return [np.asarray(encoded, dtype=dtype) for encoded in encodeds]
 
 
 class StatementEncoder(EncoderBase):
@@ -196,16 +418,29 @@ class StatementEncoder(EncoderBase):
     super(StatementEncoder, self).__init__(graph_db, cache_size)
     self.proto_db = proto_db
 
-    with open(LLVM_VOCAB) as f:
-      data_to_load = json.load(f)
-    self.vocabulary = data_to_load["vocab"]
+    self.vocabulary = ir2seq.LoadLlvmVocab()["vocab"]
+    # The vocabulary is the same for every graph encoder job, so serialize it
+    # once and parse it into each new job, rather than converting the
+    # vocabulary dictionary to a proto map field for every job.
+    self._serialized_vocabulary_job = graph2seq_pb2.GraphEncoderJob(
+      vocabulary=self.vocabulary
+    ).SerializeToString()
     self._max_encoded_length = max_encoded_length
     self.max_nodes = max_nodes
+    self._name = (
+      f"{type(self).__name__}:{self.max_encoded_length}:{self.max_nodes}:"
+      f"{encoded_sequence_cache.VocabularyHash(self.vocabulary)}"
+    )
 
   @property
   def max_encoded_length(self) -> int:
     return self._max_encoded_length
 
+  @property
+  def name(self) -> str:
+    """Return a name which identifies the configuration of the encoder."""
+    return self._name
+
   def EncodeIds(
     self, ir_ids: List[int], ctx: progress.ProgressContext
   ) -> List[graph2seq_pb2.ProgramGraphSeq]:
@@ -259,17 +494,31 @@ class StatementEncoder(EncoderBase):
       encoded sequences, subsequence groupings, and node_mask arrays which list
       the nodes which are selected from each graph.
     """
-    # Fetch the protos for the graphs that we need to encode.
+    # Fetch the protos for the graphs that we need to encode. Select only the
+    # serialized protos, rather than hydrating ORM objects which are used once,
+    # and split the IN clause to bound the number of parameters in a query.
+    # The IDs are sorted, so the protos of each chunk are in order.
     with self.proto_db.Session() as session:
-      protos_to_encode = [
-        row.proto
-        for row in session.query(unlabelled_graph_database.ProgramGraph)
-        .options(
-          sql.orm.joinedload(unlabelled_graph_database.ProgramGraph.data)
+      # Build the query once with an expanding parameter for the IDs, and bind
+      # each chunk of IDs to it.
+      query = (
+        session.query(
+          unlabelled_graph_database.ProgramGraphData.serialized_proto
+        )
+        .join(unlabelled_graph_database.ProgramGraph.data)
+        .filter(
+          unlabelled_graph_database.ProgramGraph.ir_id.in_(
+            sql.bindparam("ir_ids", expanding=True)
+          )
         )
-        .filter(unlabelled_graph_database.ProgramGraph.ir_id.in_(ir_ids))
         .order_by(unlabelled_graph_database.ProgramGraph.ir_id)
-      ]
+      )
+      protos_to_encode = []
+      for chunk in labtypes.Chunkify(ir_ids, FLAGS.graph2seq_max_ids_per_query):
+        protos_to_encode.extend(
+          programl_pb2.ProgramGraph.FromString(row.serialized_proto)
+          for row in query.params(ir_ids=chunk)
+        )
       if len(protos_to_encode) != len(ir_ids):
         raise OSError(
           f"Requested {len(ir_ids)} protos "
@@ -287,10 +536,15 @@ class StatementEncoder(EncoderBase):
       )
 
     # Squeeze the encoded representations down to the maximum lengths allowed.
+    # Truncate the repeated fields in place, rather than copying and
+    # reassigning the elements which are kept.
     for seq in encoded:
-      seq.encoded[:] = seq.encoded[: self.max_encoded_length]
-      seq.encoded_node_length[:] = seq.encoded_node_length[: self.max_nodes]
-      seq.node[:] = seq.node[: self.max_nodes]
+      if len(seq.encoded) > self.max_encoded_length:
+        del seq.encoded[self.max_encoded_length :]
+      if len(seq.encoded_node_length) > self.max_nodes:
+        del seq.encoded_node_length[self.max_nodes :]
+      if len(seq.node) > self.max_nodes:
+        del seq.node[self.max_nodes :]
 
     return encoded
 
@@ -324,15 +578,16 @@ class StatementEncoder(EncoderBase):
         f"({humanize.DecimalPrefix(token_count / t, ' tokens/sec')})"
       ),
     ):
-      message = graph2seq_pb2.GraphEncoderJob(
-        vocabulary=self.vocabulary, graph=graphs,
+      message = graph2seq_pb2.GraphEncoderJob.FromString(
+        self._serialized_vocabulary_job
       )
+      message.graph.extend(graphs)
       pbutil.RunProcessMessageInPlace(
         [str(GRAPH_ENCODER_WORKER)],
         message,
         timeout_seconds=FLAGS.graph_encoder_timeout,
       )
-      encoded_graphs = [encoded for encoded in message.seq]
+      encoded_graphs = list(message.seq)
       token_count = sum(len(encoded.encoded) for encoded in encoded_graphs)
       if len(encoded_graphs) != len(graphs):
         raise ValueError(
@@ -235,6 +235,24 @@ def test_fuzz_GraphEncoder(
   assert len(encoded) == len(graphs)
 
 
+@decorators.loop_for(seconds=2, min_iteration_count=10)
+def test_fuzz_GraphEncoder_EncodeAndPad(
+  graph_encoder: graph2seq.GraphEncoder,
+  populated_graph_db: graph_tuple_database.Database,
+):
+  """Fuzz padded encoding with the graph-level encoder."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  padded = graph_encoder.EncodeAndPad(
+    graphs, padded_length=10, padding_element=-1
+  )
+
+  assert padded.shape == (len(graphs), 10)
+  for row, encoded in zip(padded, graph_encoder.Encode(graphs)):
+    encoded = encoded[:10]
+    assert list(row[10 - len(encoded) :]) == list(encoded)
+    assert (row[: 10 - len(encoded)] == -1).all()
+
+
 @decorators.loop_for(seconds=3, min_iteration_count=10)
 def test_fuzz_StatementEncoder(
   statement_encoder: graph2seq.StatementEncoder,
@@ -249,5 +267,33 @@ def test_fuzz_StatementEncoder(
     assert max(seq.node) < graph.node_count
 
 
+def test_FrequencyAdmissionCache_lru_eviction():
+  """Test that an entry accessed more often replaces the least recent entry."""
+  cache = graph2seq.FrequencyAdmissionCache(2)
+  for key in ["a", "b", "c", "c"]:
+    if cache.get(key) is None:
+      cache[key] = key.upper()
+
+  assert "a" not in cache
+  assert cache.get("b") == "B"
+  assert cache.get("c") == "C"
+
+
+def test_FrequencyAdmissionCache_cyclic_access():
+  """Test that a cycle of keys larger than the cache does not thrash it."""
+  cache = graph2seq.FrequencyAdmissionCache(5)
+  hit_count = 0
+  for _ in range(10):
+    for key in range(10):
+      if cache.get(key) is None:
+        cache[key] = key
+      else:
+        hit_count += 1
+
+  assert len(cache) == 5
+  # A plain LRU cache would never hit.
+  assert hit_count >= 5 * 9
+
+
 if __name__ == "__main__":
   test.Main()
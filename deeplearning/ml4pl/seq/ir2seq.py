@@ -14,7 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Module to convert intermediate representations into vocabulary sequences."""
+import functools
 import json
+from typing import Any
+from typing import Dict
 from typing import List
 from typing import Tuple
 
@@ -40,6 +43,20 @@ FLAGS = app.FLAGS
 LLVM_VOCAB = bazelutil.DataPath("phd/deeplearning/ml4pl/seq/llvm_vocab.json")
 
 
+@functools.lru_cache(maxsize=1)
+def LoadLlvmVocab() -> Dict[str, Any]:
+  """Load the LLVM vocabulary.
+
+  The vocabulary file is parsed once and shared by all encoders, so the returned
+  dictionary must not be modified.
+
+  Returns:
+    A dictionary with "vocab" and "max_encoded_length" keys.
+  """
+  with open(LLVM_VOCAB) as f:
+    return json.load(f)
+
+
 class EncoderBase(object):
   """Base class for implementing bytecode encoders."""
 
@@ -62,6 +79,11 @@ class EncoderBase(object):
     """Convert a list of strings to a list of encoded sequences."""
     raise NotImplementedError("abstract class")
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Get the vocabulary, as a mapping from element to index."""
+    raise NotImplementedError("abstract class")
+
   @property
   def vocabulary_size(self) -> int:
     """Get the size of the vocabulary, including the unknown-vocab element."""
@@ -80,8 +102,7 @@ class LlvmEncoder(EncoderBase):
     super(LlvmEncoder, self).__init__(*args, **kwargs)
 
     # Load the vocabulary used for encoding LLVM bytecode.
-    with open(LLVM_VOCAB) as f:
-      data_to_load = json.load(f)
+    data_to_load = LoadLlvmVocab()
     vocab = data_to_load["vocab"]
     self._max_encoded_length = data_to_load["max_encoded_length"]
 
@@ -141,6 +162,11 @@ class LlvmEncoder(EncoderBase):
   ) -> List[np.array]:
     return self.lexer.Lex(strings, ctx=ctx)
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Get the vocabulary, as a mapping from element to index."""
+    return self.lexer.vocab
+
   @property
   def vocabulary_size(self) -> int:
     """Return the size of the encoder vocabulary."""
@@ -239,6 +265,11 @@ class OpenClEncoder(EncoderBase):
   ) -> List[np.array]:
     raise TypeError("OpenCL encoder does not support encoding strings")
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Get the vocabulary, as a mapping from element to index."""
+    return self.lexer.vocab
+
   @property
   def vocabulary_size(self) -> int:
     """Return the size of the encoder vocabulary."""
@@ -333,6 +364,11 @@ class Inst2VecEncoder(EncoderBase):
       for string in strings
     ]
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Get the vocabulary, as a mapping from element to index."""
+    return self.vocab.dictionary
+
   @property
   def vocabulary_size(self) -> int:
     """Get the size of the vocabulary."""
@@ -18,7 +18,6 @@ from typing import Iterable
 from typing import Optional
 
 from deeplearning.ml4pl.graphs.labelled import graph_tuple
-from deeplearning.ml4pl.testing import random_networkx_generator
 from deeplearning.ml4pl.testing import random_programl_generator
 from labm8.py import test
 
@@ -47,8 +46,10 @@ def CreateRandomGraphTuple(
     5. Edges have positions.
     6. The graph is strongly connected.
   """
-  graphs = [
-    random_networkx_generator.CreateRandomGraph(
+  # Build the graph tuples directly from the protos rather than converting them
+  # to networkx first.
+  protos = [
+    random_programl_generator.CreateRandomProto(
       node_x_dimensionality=node_x_dimensionality,
       node_y_dimensionality=node_y_dimensionality,
       graph_x_dimensionality=graph_x_dimensionality,
@@ -59,7 +60,7 @@ def CreateRandomGraphTuple(
   ]
 
   graph_tuples = [
-    graph_tuple.GraphTuple.CreateFromNetworkX(graph) for graph in graphs
+    graph_tuple.GraphTuple.CreateFromProgramGraph(proto) for proto in protos
   ]
   if len(graph_tuples) > 1:
     return graph_tuple.GraphTuple.FromGraphTuples(graph_tuples)
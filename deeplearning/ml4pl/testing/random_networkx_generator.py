@@ -14,7 +14,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """This module defines a generator for random graph tuples."""
+import copy
 from typing import Iterable
+from typing import List
 from typing import Optional
 
 import networkx as nx
@@ -26,6 +28,10 @@ from labm8.py import test
 
 FLAGS = test.FLAGS
 
+# The graphs of the test set, populated on the first full enumeration of
+# EnumerateTestSet().
+_test_set: Optional[List[nx.MultiDiGraph]] = None
+
 
 def CreateRandomGraph(
   node_x_dimensionality: int = 1,
@@ -58,6 +64,24 @@ def CreateRandomGraph(
 
 
 def EnumerateTestSet(n: Optional[int] = None) -> Iterable[nx.MultiDiGraph]:
-  """Enumerate a test set of "real" graphs."""
+  """Enumerate a test set of "real" graphs.
+
+  Converting the test set to networkx is slow, so the graphs are cached after
+  the first full enumeration. Callers receive deep copies of the cached graphs,
+  including their node and edge attributes, so they are free to modify them.
+  """
+  global _test_set
+
+  if _test_set is not None:
+    for graph in _test_set[:n] if n else _test_set:
+      yield copy.deepcopy(graph)
+    return
+
+  graphs = []
   for proto in random_programl_generator.EnumerateTestSet(n=n):
-    yield programl.ProgramGraphToNetworkX(proto)
+    graph = programl.ProgramGraphToNetworkX(proto)
+    graphs.append(graph)
+    yield copy.deepcopy(graph)
+
+  if not n:
+    _test_set = graphs
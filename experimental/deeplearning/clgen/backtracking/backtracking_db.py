@@ -4,6 +4,7 @@ import typing
 
 import numpy as np
 import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext import declarative
 
 from labm8.py import app
@@ -59,6 +60,60 @@ class FeatureVector(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
       "coalesced_memory_access_count": features[3],
     }
 
+  @classmethod
+  def BulkGetOrAdd(
+    cls,
+    session: sqlutil.Session,
+    feature_vectors: typing.List[typing.Dict[str, int]],
+  ) -> typing.List[int]:
+    """Return the IDs of feature vectors, adding any which do not exist.
+
+    This adds all new feature vectors with a single multi-row INSERT that skips
+    existing rows, then looks up the IDs of all feature vectors with a single
+    SELECT.
+
+    Args:
+      session: A database session.
+      feature_vectors: A list of dictionaries, as returned by FromNumpyArray().
+
+    Returns:
+      A list of feature vector IDs, in the same order as the inputs.
+    """
+    if not feature_vectors:
+      return []
+
+    columns = (
+      "compute_operation_count",
+      "global_memory_access_count",
+      "local_memory_access_count",
+      "coalesced_memory_access_count",
+    )
+    # Convert numpy integers to Python integers for the database driver.
+    keys = [tuple(int(fv[c]) for c in columns) for fv in feature_vectors]
+    rows = [dict(zip(columns, key)) for key in set(keys)]
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+      insert = postgresql.insert(cls).on_conflict_do_nothing(
+        constraint="unique_feature_vector"
+      )
+    elif dialect == "mysql":
+      insert = sql.insert(cls).prefix_with("IGNORE")
+    else:
+      insert = sql.insert(cls).prefix_with("OR IGNORE")
+    session.execute(insert, rows)
+
+    query = session.query(cls.id, *[getattr(cls, c) for c in columns]).filter(
+      sql.or_(
+        *[
+          sql.and_(*[getattr(cls, c) == row[c] for c in columns])
+          for row in rows
+        ]
+      )
+    )
+    key_to_id = {tuple(row[1:]): row[0] for row in query}
+    return [key_to_id[key] for key in keys]
+
   def ToNumpyArray(self) -> np.array:
     return np.array(
       [
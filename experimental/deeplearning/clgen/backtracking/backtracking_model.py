@@ -355,10 +355,14 @@ class BacktrackingModel(models.Model):
 
     backtracker = OpenClBacktrackingHelper(atomizer, self._target_features)
     self._logger.OnSampleStart(backtracker)
-    sampled_tokens = self.SampleOneWithBacktracking(
-      sampler, atomizer, backtracker
-    )
-    self._logger.OnSampleEnd(backtracker)
+    try:
+      sampled_tokens = self.SampleOneWithBacktracking(
+        sampler, atomizer, backtracker
+      )
+    finally:
+      # Always end the sample so that the logger writes any buffered steps,
+      # even if sampling fails or is interrupted.
+      self._logger.OnSampleEnd(backtracker)
 
     end_time = labdate.MillisecondsTimestamp()
 
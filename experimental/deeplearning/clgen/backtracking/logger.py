@@ -1,13 +1,26 @@
 """Results logging for backtracking experiments."""
 import time
+import typing
+
+import numpy as np
+import sqlalchemy as sql
 
 from experimental.deeplearning.clgen.backtracking import backtracking_db
 from experimental.deeplearning.clgen.backtracking import backtracking_model
 from labm8.py import app
 from labm8.py import humanize
+from labm8.py import labdate
 
 FLAGS = app.FLAGS
 
+app.DEFINE_integer(
+  "backtracking_log_flush_steps",
+  32,
+  "The number of backtracking steps to buffer before writing them to the "
+  "database in a single transaction. Buffered steps are always written at the "
+  "end of a sample.",
+)
+
 
 class BacktrackingLogger(object):
   def OnSampleStart(
@@ -30,25 +43,32 @@ class BacktrackingLogger(object):
 
 
 class BacktrackingDatabaseLogger(BacktrackingLogger):
+  """Log backtracking steps to a database.
+
+  Only one logger may write to a database at a time. A job's ID is one more
+  than the largest job ID in the database when the sample starts, but steps
+  are buffered and not written until the buffer is flushed. Concurrent
+  loggers could therefore be assigned the same job ID.
+  """
+
   def __init__(self, db: backtracking_db.Database):
     self._db = db
     self._job_id = None
     self._step_count = 0
     self._target_features_id = None
     self._start_time = None
+    # Steps which have not yet been written to the database.
+    self._pending_steps: typing.List[typing.Dict[str, typing.Any]] = []
+    # A map from the bytes of a feature vector to its database ID.
+    self._features_ids: typing.Dict[bytes, int] = {}
 
   def OnSampleStart(
     self, backtracker: backtracking_model.OpenClBacktrackingHelper
   ):
-    with self._db.Session(commit=True) as session:
-      target_features = session.GetOrAdd(
-        backtracking_db.FeatureVector,
-        **backtracking_db.FeatureVector.FromNumpyArray(
-          backtracker.target_features
-        ),
-      )
-      session.flush()
-      self._target_features_id = target_features.id
+    self._target_features_id = self._GetFeaturesIds(
+      [backtracker.target_features]
+    )[0]
+    self._job_id = self._GetNextJobId()
 
     self._step_count = 0
     self._start_time = time.time()
@@ -59,7 +79,7 @@ class BacktrackingDatabaseLogger(BacktrackingLogger):
     attempt_count: int,
     token_count: int,
   ):
-    job_id = self.job_id
+    job_id = self._job_id
     self._step_count += 1
 
     runtime_ms = int((time.time() - self._start_time) * 1000)
@@ -74,53 +94,94 @@ class BacktrackingDatabaseLogger(BacktrackingLogger):
       1, "Job %d started %s", job_id, humanize.Duration(runtime_ms / 1000)
     )
 
-    with self._db.Session(commit=True) as session:
-      features = session.GetOrAdd(
-        backtracking_db.FeatureVector,
-        **backtracking_db.FeatureVector.FromNumpyArray(
-          backtracker.current_features
-        ),
-      )
-      session.flush()
-
-      step = backtracking_db.BacktrackingStep(
-        job_id=job_id,
-        runtime_ms=runtime_ms,
-        target_features_id=self._target_features_id,
-        features_id=features.id,
-        feature_distance=backtracker.feature_distance,
-        norm_feature_distance=backtracker.norm_feature_distance,
-        step=self._step_count,
-        attempt_count=attempt_count,
-        src=backtracker.current_src,
-        token_count=token_count,
-      )
-      session.add(step)
+    # Buffer the step. The features are resolved to IDs when the buffer is
+    # written, and the date is set now since the write may be much later.
+    self._pending_steps.append(
+      {
+        "job_id": job_id,
+        "runtime_ms": runtime_ms,
+        "target_features_id": self._target_features_id,
+        "features": backtracker.current_features.copy(),
+        "feature_distance": backtracker.feature_distance,
+        "norm_feature_distance": backtracker.norm_feature_distance,
+        "step": self._step_count,
+        "attempt_count": attempt_count,
+        "date": labdate.GetUtcMillisecondsNow(),
+        "src": backtracker.current_src,
+        "token_count": token_count,
+      }
+    )
+    if len(self._pending_steps) >= FLAGS.backtracking_log_flush_steps:
+      self.Flush()
 
   def OnSampleEnd(
     self, backtracker: backtracking_model.OpenClBacktrackingHelper
   ):
     del backtracker
+    self.Flush()
     self._step_count += 1
     app.Log(1, "Sampling concluded at step %d", self._step_count)
     self._job_id = None
     self._step_count = 0
     self._target_features_id = None
 
-  @property
-  def job_id(self) -> int:
-    """Get the unique job ID."""
-    if self._job_id is None:
-      with self._db.Session(commit=True) as session:
-        result = (
-          session.query(backtracking_db.BacktrackingStep.job_id)
-          .order_by(backtracking_db.BacktrackingStep.job_id.desc())
-          .limit(1)
-          .first()
+  def Flush(self) -> None:
+    """Write the buffered steps to the database in a single transaction."""
+    if not self._pending_steps:
+      return
+
+    features_ids = self._GetFeaturesIds(
+      [step["features"] for step in self._pending_steps]
+    )
+    # Build new rows rather than modifying the buffered steps, so that the
+    # buffer is unchanged if the write fails.
+    rows = []
+    for step, features_id in zip(self._pending_steps, features_ids):
+      row = {k: v for k, v in step.items() if k != "features"}
+      row["features_id"] = features_id
+      rows.append(row)
+
+    with self._db.Session(commit=True) as session:
+      session.bulk_insert_mappings(backtracking_db.BacktrackingStep, rows)
+    self._pending_steps = []
+
+  def _GetFeaturesIds(
+    self, features: typing.List[np.array]
+  ) -> typing.List[int]:
+    """Return the database IDs of feature vectors, adding them if required."""
+    keys = [f.tobytes() for f in features]
+    if all(key in self._features_ids for key in keys):
+      return [self._features_ids[key] for key in keys]
+
+    unknown_keys, unknown_features = [], []
+    for key, f in zip(keys, features):
+      if key not in self._features_ids:
+        unknown_keys.append(key)
+        unknown_features.append(
+          backtracking_db.FeatureVector.FromNumpyArray(f)
+        )
+
+    with self._db.Session(commit=True) as session:
+      new_features_ids = dict(
+        zip(
+          unknown_keys,
+          backtracking_db.FeatureVector.BulkGetOrAdd(
+            session, unknown_features
+          ),
+        )
+      )
+    # Only cache the IDs once the transaction has been committed.
+    self._features_ids.update(new_features_ids)
+    return [self._features_ids[key] for key in keys]
+
+  def _GetNextJobId(self) -> int:
+    """Get a new job ID. This assumes that there is a single writer."""
+    with self._db.Session() as session:
+      max_job_id = session.query(
+        sql.func.coalesce(
+          sql.func.max(backtracking_db.BacktrackingStep.job_id), 0
         )
-        if result:
-          self._job_id = result[0] + 1
-        else:
-          self._job_id = 1
-      app.Log(1, "New job ID %d", self._job_id)
-    return self._job_id
+      ).scalar()
+    job_id = max_job_id + 1
+    app.Log(1, "New job ID %d", job_id)
+    return job_id
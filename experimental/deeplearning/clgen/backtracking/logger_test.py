@@ -0,0 +1,137 @@
+"""Unit tests for //experimental/deeplearning/clgen/backtracking:logger."""
+import pathlib
+
+import numpy as np
+
+from experimental.deeplearning.clgen.backtracking import backtracking_db
+from experimental.deeplearning.clgen.backtracking import logger as logger_lib
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+
+class MockBacktracker(object):
+  """A mock backtracking helper with the attributes read by the logger."""
+
+  def __init__(self):
+    self.target_features = np.array([1, 2, 3, 4], dtype=int)
+    self.current_features = np.array([0, 0, 0, 0], dtype=int)
+    self.feature_distance = 1.0
+    self.norm_feature_distance = 0.5
+    self.current_src = "kernel void A() {}"
+
+
+@test.Fixture(scope="function")
+def db(tempdir: pathlib.Path) -> backtracking_db.Database:
+  yield backtracking_db.Database(f"sqlite:///{tempdir}/db")
+
+
+@test.Fixture(scope="function")
+def logger(
+  db: backtracking_db.Database,
+) -> logger_lib.BacktrackingDatabaseLogger:
+  FLAGS.backtracking_log_flush_steps = 3
+  yield logger_lib.BacktrackingDatabaseLogger(db)
+
+
+def StepCount(db: backtracking_db.Database) -> int:
+  with db.Session() as session:
+    return session.query(backtracking_db.BacktrackingStep).count()
+
+
+def FeatureVectorCount(db: backtracking_db.Database) -> int:
+  with db.Session() as session:
+    return session.query(backtracking_db.FeatureVector).count()
+
+
+def test_BacktrackingDatabaseLogger_flushes_at_threshold(
+  db: backtracking_db.Database,
+  logger: logger_lib.BacktrackingDatabaseLogger,
+):
+  """Test that steps are written once the buffer reaches the threshold."""
+  backtracker = MockBacktracker()
+  logger.OnSampleStart(backtracker)
+
+  logger.OnSampleStep(backtracker, 1, 10)
+  logger.OnSampleStep(backtracker, 1, 20)
+  assert StepCount(db) == 0
+
+  logger.OnSampleStep(backtracker, 1, 30)
+  assert StepCount(db) == 3
+
+  logger.OnSampleStep(backtracker, 1, 40)
+  assert StepCount(db) == 3
+
+
+def test_BacktrackingDatabaseLogger_OnSampleEnd_flushes(
+  db: backtracking_db.Database,
+  logger: logger_lib.BacktrackingDatabaseLogger,
+):
+  """Test that the remaining buffered steps are written at sample end."""
+  backtracker = MockBacktracker()
+  logger.OnSampleStart(backtracker)
+  for i in range(5):
+    logger.OnSampleStep(backtracker, 1, i)
+  logger.OnSampleEnd(backtracker)
+
+  assert StepCount(db) == 5
+  with db.Session() as session:
+    steps = session.query(backtracking_db.BacktrackingStep).order_by(
+      backtracking_db.BacktrackingStep.step
+    )
+    assert [step.step for step in steps] == [1, 2, 3, 4, 5]
+    assert [step.token_count for step in steps] == [0, 1, 2, 3, 4]
+
+
+def test_BacktrackingDatabaseLogger_reuses_feature_vectors(
+  db: backtracking_db.Database,
+  logger: logger_lib.BacktrackingDatabaseLogger,
+):
+  """Test that each unique feature vector is stored once."""
+  backtracker = MockBacktracker()
+  logger.OnSampleStart(backtracker)
+  for i in range(7):
+    # Alternate between two feature vectors.
+    backtracker.current_features = np.array([i % 2, 0, 0, 0], dtype=int)
+    logger.OnSampleStep(backtracker, 1, i)
+  logger.OnSampleEnd(backtracker)
+
+  # The target features plus two current feature vectors.
+  assert FeatureVectorCount(db) == 3
+  with db.Session() as session:
+    features_ids = {
+      step.features_id
+      for step in session.query(backtracking_db.BacktrackingStep)
+    }
+    target_features_ids = {
+      step.target_features_id
+      for step in session.query(backtracking_db.BacktrackingStep)
+    }
+  assert len(features_ids) == 2
+  assert len(target_features_ids) == 1
+  assert not features_ids.intersection(target_features_ids)
+
+
+def test_BacktrackingDatabaseLogger_job_ids_increase(
+  db: backtracking_db.Database,
+  logger: logger_lib.BacktrackingDatabaseLogger,
+):
+  """Test that each sample is logged with a new job ID."""
+  backtracker = MockBacktracker()
+  for _ in range(2):
+    logger.OnSampleStart(backtracker)
+    logger.OnSampleStep(backtracker, 1, 10)
+    logger.OnSampleEnd(backtracker)
+
+  with db.Session() as session:
+    job_ids = [
+      step.job_id
+      for step in session.query(backtracking_db.BacktrackingStep).order_by(
+        backtracking_db.BacktrackingStep.id
+      )
+    ]
+  assert job_ids == [1, 2]
+
+
+if __name__ == "__main__":
+  test.Main()
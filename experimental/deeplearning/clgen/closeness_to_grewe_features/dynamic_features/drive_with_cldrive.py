@@ -1,7 +1,11 @@
 """Run kernels in features database using CGO'17 driver and settings."""
+import functools
+import multiprocessing
+import multiprocessing.pool
 import typing
 
 import numpy as np
+import pandas as pd
 import sqlalchemy as sql
 
 from experimental.deeplearning.clgen.closeness_to_grewe_features import (
@@ -53,6 +57,13 @@ app.DEFINE_boolean(
   "slow for large databases, but is useful when you have multiple "
   "concurrent workers to prevent races.",
 )
+app.DEFINE_integer(
+  "cldrive_processes",
+  1,
+  "The number of kernels to drive concurrently. Each kernel is driven in a "
+  "separate worker process, and results are written to the database by the "
+  "main process.",
+)
 app.DEFINE_boolean(
   "reverse_order",
   False,
@@ -78,12 +89,21 @@ def GetBatchOfKernelsToDrive(
   session: sqlutil.Session, env: cldrive_env.OpenCLEnvironment, batch_size: int
 ):
   """Get a batch of kernels to run."""
-  already_done = session.query(db.DynamicFeatures.static_features_id).filter(
-    db.DynamicFeatures.opencl_env == env.name,
-    db.DynamicFeatures.driver == db.DynamicFeaturesDriver.CLDRIVE,
-  )
-  q = session.query(db.StaticFeatures.id, db.StaticFeatures.src).filter(
-    ~db.StaticFeatures.id.in_(already_done)
+  # Select the static features which have no dynamic features for this
+  # environment using an anti-join, rather than NOT IN (subquery), which many
+  # engines re-evaluate for each candidate row, and which grows slower as more
+  # kernels are driven.
+  q = (
+    session.query(db.StaticFeatures.id, db.StaticFeatures.src)
+    .outerjoin(
+      db.DynamicFeatures,
+      sql.and_(
+        db.DynamicFeatures.static_features_id == db.StaticFeatures.id,
+        db.DynamicFeatures.opencl_env == env.name,
+        db.DynamicFeatures.driver == db.DynamicFeaturesDriver.CLDRIVE,
+      ),
+    )
+    .filter(db.DynamicFeatures.static_features_id == None)
   )
 
   if FLAGS.random_order:
@@ -95,26 +115,18 @@ def GetBatchOfKernelsToDrive(
   return [KernelToDrive(*row) for row in q]
 
 
-def DriveKernelAndRecordResults(
-  database: db.Database,
-  static_features_id: int,
+def DriveKernel(
   src: str,
   env: cldrive_env.OpenCLEnvironment,
   dynamic_params: typing.List[cldrive_pb2.DynamicParams],
   num_runs: int,
-) -> None:
-  """Drive a single kernel and record results."""
-
-  def ErrorFeatures(outcome: str) -> db.DynamicFeatures:
-    return db.DynamicFeatures(
-      static_features_id=static_features_id,
-      driver=db.DynamicFeaturesDriver.CLDRIVE,
-      opencl_env=env.name,
-      hostname=system.HOSTNAME,
-      outcome=outcome,
-      run_count=0,
-    )
+) -> typing.Union[pd.DataFrame, str]:
+  """Drive a single kernel.
 
+  Returns:
+    A dataframe of dynamic features, or the name of an outcome if the kernel
+    could not be driven.
+  """
   try:
     df = cldrive.DriveToDataFrame(
       cldrive_pb2.CldriveInstances(
@@ -129,81 +141,146 @@ def DriveKernelAndRecordResults(
       ),
       timeout_seconds=FLAGS.cldrive_timeout_seconds,
     )
-
-    # Record programs which contain no kernels.
-    if not len(df):
-      with database.Session(commit=True) as session:
-        session.add(ErrorFeatures("NO_KERNELS"))
-      return
-
-    # Remove the columns which are not exported to the database:
-    # 'instance' is not used since we only drive a single instance at a time.
-    # 'build_opts' is never changed. 'kernel' is not needed because each static
-    # features entry is a single kernel.
-    df.drop(columns=["instance", "build_opts", "kernel"], inplace=True)
-
-    # Fix the naming differences between cldrive and the database.
-    df.rename(
-      columns={
-        "device": "opencl_env",
-        "global_size": "gsize",
-        "local_size": "wgsize",
-      },
-      inplace=True,
-    )
-
-    # NaN values are excluded in groupby statements, and we need to groupby
-    # columns that may be NaN (gsize and wgsize). Replace NaN with -1 since all
-    # integer column values are >= 0, so this value will never occur normally.
-    # See: https://github.com/pandas-dev/pandas/issues/3729
-    nan_placeholder = -1
-    df[["gsize", "wgsize"]] = df[["gsize", "wgsize"]].fillna(nan_placeholder)
-
-    # Aggregate runtimes and append run_count.
-    groupby_columns = ["opencl_env", "gsize", "wgsize", "outcome"]
-    run_counts = df.groupby(groupby_columns).count()["kernel_time_ns"]
-    df = df.groupby(groupby_columns).mean()
-    df["run_count"] = run_counts
-    df.reset_index(inplace=True)
-
-    # Now that we have done the groupby, replace the NaN placeholder values
-    # with true NaN.
-    df[["gsize", "wgsize"]] = df[["gsize", "wgsize"]].replace(
-      nan_placeholder, np.nan
-    )
-
-    # Add missing columns.
-    df["static_features_id"] = static_features_id
-    df["driver"] = db.DynamicFeaturesDriver.CLDRIVE
-    df["hostname"] = system.HOSTNAME
-
-    # Import the dataframe into the SQL table.
-    df.to_sql(
-      db.DynamicFeatures.__tablename__,
-      con=database.engine,
-      if_exists="append",
-      index=False,
-      dtype={"driver": sql.Enum(db.DynamicFeaturesDriver)},
-    )
-    app.Log(1, "Imported %d dynamic features", len(df))
   except cldrive.CldriveCrash:
-    with database.Session(commit=True) as session:
-      session.add(ErrorFeatures("DRIVER_CRASH"))
     app.Log(1, "Driver crashed")
+    return "DRIVER_CRASH"
   except pbutil.ProtoWorkerTimeoutError:
-    with database.Session(commit=True) as session:
-      session.add(ErrorFeatures("DRIVER_TIMEOUT"))
     app.Log(1, "Driver timed out")
+    return "DRIVER_TIMEOUT"
+
+  # Record programs which contain no kernels.
+  if not len(df):
+    return "NO_KERNELS"
+
+  # Remove the columns which are not exported to the database:
+  # 'instance' is not used since we only drive a single instance at a time.
+  # 'build_opts' is never changed. 'kernel' is not needed because each static
+  # features entry is a single kernel.
+  df.drop(columns=["instance", "build_opts", "kernel"], inplace=True)
+
+  # Fix the naming differences between cldrive and the database.
+  df.rename(
+    columns={
+      "device": "opencl_env",
+      "global_size": "gsize",
+      "local_size": "wgsize",
+    },
+    inplace=True,
+  )
+
+  # NaN values are excluded in groupby statements, and we need to groupby
+  # columns that may be NaN (gsize and wgsize). Replace NaN with -1 since all
+  # integer column values are >= 0, so this value will never occur normally.
+  # See: https://github.com/pandas-dev/pandas/issues/3729
+  nan_placeholder = -1
+  df[["gsize", "wgsize"]] = df[["gsize", "wgsize"]].fillna(nan_placeholder)
+
+  # Aggregate runtimes and append run_count.
+  groupby_columns = ["opencl_env", "gsize", "wgsize", "outcome"]
+  run_counts = df.groupby(groupby_columns).count()["kernel_time_ns"]
+  df = df.groupby(groupby_columns).mean()
+  df["run_count"] = run_counts
+  df.reset_index(inplace=True)
+
+  # Now that we have done the groupby, replace the NaN placeholder values
+  # with true NaN.
+  df[["gsize", "wgsize"]] = df[["gsize", "wgsize"]].replace(
+    nan_placeholder, np.nan
+  )
+  return df
+
+
+def RecordResults(
+  database: db.Database,
+  static_features_id: int,
+  env: cldrive_env.OpenCLEnvironment,
+  results: typing.Union[pd.DataFrame, str],
+) -> None:
+  """Record the results of DriveKernel() in the database."""
+  if isinstance(results, str):
+    with database.Session(commit=True) as session:
+      session.add(
+        db.DynamicFeatures(
+          static_features_id=static_features_id,
+          driver=db.DynamicFeaturesDriver.CLDRIVE,
+          opencl_env=env.name,
+          hostname=system.HOSTNAME,
+          outcome=results,
+          run_count=0,
+        )
+      )
+    return
+
+  df = results
+
+  # Add missing columns.
+  df["static_features_id"] = static_features_id
+  df["driver"] = db.DynamicFeaturesDriver.CLDRIVE
+  df["hostname"] = system.HOSTNAME
+
+  # Import the dataframe into the SQL table.
+  df.to_sql(
+    db.DynamicFeatures.__tablename__,
+    con=database.engine,
+    if_exists="append",
+    index=False,
+    dtype={"driver": sql.Enum(db.DynamicFeaturesDriver)},
+  )
+  app.Log(1, "Imported %d dynamic features", len(df))
+
+
+def DriveKernelAndRecordResults(
+  database: db.Database,
+  static_features_id: int,
+  src: str,
+  env: cldrive_env.OpenCLEnvironment,
+  dynamic_params: typing.List[cldrive_pb2.DynamicParams],
+  num_runs: int,
+) -> None:
+  """Drive a single kernel and record results."""
+  results = DriveKernel(src, env, dynamic_params, num_runs)
+  RecordResults(database, static_features_id, env, results)
+
+
+def _DriveKernelWorker(
+  kernel: KernelToDrive,
+  env: cldrive_env.OpenCLEnvironment,
+  dynamic_params: typing.List[cldrive_pb2.DynamicParams],
+  num_runs: int,
+) -> typing.Tuple[int, typing.Union[pd.DataFrame, str]]:
+  """Drive a kernel in a worker process and return its ID and results."""
+  return kernel.id, DriveKernel(kernel.src, env, dynamic_params, num_runs)
 
 
 def DriveBatchAndRecordResults(
   database: db.Database,
   batch: typing.List[KernelToDrive],
   env: cldrive_env.OpenCLEnvironment,
+  pool: typing.Optional[multiprocessing.pool.Pool] = None,
 ) -> None:
-  """Drive a batch of kernels and record dynamic features."""
+  """Drive a batch of kernels and record dynamic features.
+
+  Args:
+    database: The database to record results to.
+    batch: The kernels to drive.
+    env: The OpenCL environment to drive the kernels on.
+    pool: An optional pool of worker processes to drive the kernels in. Results
+      are recorded by this process, so there is a single database writer.
+  """
   # Irrespective of batch size we still run each program in the batch as
   # separate cldrive instance.
+  if pool:
+    worker = functools.partial(
+      _DriveKernelWorker,
+      env=env,
+      dynamic_params=LSIZE_GSIZE_PROTO_PAIRS,
+      num_runs=FLAGS.num_runs,
+    )
+    with prof.Profile(f"Run {len(batch)} static features"):
+      for static_features_id, results in pool.imap_unordered(worker, batch):
+        RecordResults(database, static_features_id, env, results)
+    return
+
   for static_features_id, src in batch:
     with prof.Profile(f"Run static features ID {static_features_id}"):
       DriveKernelAndRecordResults(
@@ -224,17 +301,26 @@ def main(argv: typing.List[str]):
   database = db.Database(FLAGS.db)
   env = cldrive_env.OpenCLEnvironment.FromName(FLAGS.env)
 
+  pool = None
+  if FLAGS.cldrive_processes > 1:
+    pool = multiprocessing.Pool(FLAGS.cldrive_processes)
+
   batch_num = 0
-  while True:
-    batch_num += 1
-    with database.Session() as session, prof.Profile(f"Batch {batch_num}"):
-      with prof.Profile(f"Get batch of {FLAGS.batch_size} kernels"):
-        batch = GetBatchOfKernelsToDrive(session, env, FLAGS.batch_size)
-    if not batch:
-      app.Log(1, "Done. Nothing more to run!")
-      return
-
-    DriveBatchAndRecordResults(database, batch, env)
+  try:
+    while True:
+      batch_num += 1
+      with database.Session() as session, prof.Profile(f"Batch {batch_num}"):
+        with prof.Profile(f"Get batch of {FLAGS.batch_size} kernels"):
+          batch = GetBatchOfKernelsToDrive(session, env, FLAGS.batch_size)
+      if not batch:
+        app.Log(1, "Done. Nothing more to run!")
+        return
+
+      DriveBatchAndRecordResults(database, batch, env, pool=pool)
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 """Unit tests for //experimental/deeplearning/clgen/closeness_to_grewe_features/dynamic_features:drive_with_cldrive."""
+import multiprocessing
+
 import pytest
 
 from experimental.deeplearning.clgen.closeness_to_grewe_features import (
@@ -12,6 +14,8 @@ from gpu.cldrive.proto import cldrive_pb2
 from labm8.py import system
 from labm8.py import test
 
+FLAGS = test.FLAGS
+
 
 def _DynamicFeatures(
   static_features: grewe_features_db.StaticFeatures,
@@ -106,6 +110,41 @@ def test_DriveKernelAndRecordResults(
       assert record.kernel_time_ns >= 100  # Flaky but likely.
 
 
+@test.XFail(reason="github.com/ChrisCummins/phd/issues/69")
+def test_DriveBatchAndRecordResults_pool(
+  db: grewe_features_db.Database, env: cldrive_env.OpenCLEnvironment
+):
+  """Test driving a batch of kernels with a pool of worker processes."""
+  FLAGS.num_runs = 3
+  with db.Session() as s:
+    batch = drive_with_cldrive.GetBatchOfKernelsToDrive(s, env, 16)
+  assert len(batch) == 3
+
+  pool = multiprocessing.Pool(2)
+  try:
+    drive_with_cldrive.DriveBatchAndRecordResults(db, batch, env, pool=pool)
+  finally:
+    pool.close()
+    pool.join()
+
+  with db.Session() as s:
+    for static_features_id, _ in batch:
+      records = (
+        s.query(grewe_features_db.DynamicFeatures)
+        .filter(
+          grewe_features_db.DynamicFeatures.static_features_id
+          == static_features_id
+        )
+        .all()
+      )
+      assert len(records) == len(drive_with_cldrive.LSIZE_GSIZE_PROTO_PAIRS)
+      for record in records:
+        assert record.opencl_env == env.name
+        assert record.hostname == system.HOSTNAME
+        assert record.outcome == "PASS"
+        assert record.run_count == 3
+
+
 @test.XFail(reason="github.com/ChrisCummins/phd/issues/69")
 @test.Parametrize("num_runs", [3, 5, 10])
 @test.Parametrize(
@@ -4,13 +4,14 @@ This assembles a CLgen corpus from a directory of sample texts, then uses the
 cldrive DeepSmith harness to attempt to run all of the successfully preprocessed
 files.
 """
+import collections
 import math
 import os
 import pathlib
 import pickle
+import sqlite3
 import typing
 
-import numpy as np
 import pandas as pd
 
 from deeplearning.clgen.corpuses import corpuses
@@ -166,6 +167,48 @@ def GetOutcomeWithDynamicChecks(
   return "PASS"
 
 
+class OutcomeCache(object):
+  """A cache of the outcomes of batches of kernels.
+
+  Outcomes are stored in a single SQLite database, rather than one file per
+  batch.
+  """
+
+  def __init__(self, cache_dir: pathlib.Path):
+    self._cache_dir = cache_dir
+    self._connection = sqlite3.connect(str(cache_dir / "outcomes.db"))
+    self._connection.execute(
+      "CREATE TABLE IF NOT EXISTS outcomes "
+      "(batch_id INTEGER PRIMARY KEY, outcomes BLOB NOT NULL)"
+    )
+    self._connection.commit()
+
+  def Get(self, batch_id: int) -> typing.Optional[typing.List[str]]:
+    """Return the cached outcomes of a batch, or None if not cached."""
+    row = self._connection.execute(
+      "SELECT outcomes FROM outcomes WHERE batch_id = ?", (batch_id,)
+    ).fetchone()
+    if row:
+      return pickle.loads(row[0])
+
+    # Import results cached by earlier versions of this script, which wrote
+    # one pickle file per batch.
+    legacy_path = self._cache_dir / f"{batch_id}.pkl"
+    if legacy_path.is_file():
+      with open(legacy_path, "rb") as f:
+        outcomes = pickle.load(f)
+      self.Put(batch_id, outcomes)
+      return outcomes
+
+  def Put(self, batch_id: int, outcomes: typing.List[str]) -> None:
+    """Cache the outcomes of a batch."""
+    self._connection.execute(
+      "INSERT OR REPLACE INTO outcomes (batch_id, outcomes) VALUES (?, ?)",
+      (batch_id, pickle.dumps(outcomes)),
+    )
+    self._connection.commit()
+
+
 def main(argv: typing.List[str]):
   """Main entry point."""
   if len(argv) > 1:
@@ -196,6 +239,7 @@ def main(argv: typing.List[str]):
 
   cache_dir = pathlib.Path(FLAGS.result_cache_dir) / corpus.hash
   cache_dir.mkdir(parents=True, exist_ok=True)
+  cache = OutcomeCache(cache_dir)
 
   driver = cldrive.CldriveHarness(
     harness_pb2.CldriveHarness(
@@ -224,25 +268,23 @@ def main(argv: typing.List[str]):
       humanize.Commas(num_files),
     )
 
-    srcs = [x[0] for x in q]
     batch_size = 8
-    max_batch = math.ceil(len(srcs) / batch_size)
+    max_batch = math.ceil(num_good_files / batch_size)
 
-    all_outcomes = []
-    for i, start_idx in enumerate(range(0, len(srcs), batch_size)):
-      cached_results_path = cache_dir / f"{i}.pkl"
+    # Stream the kernels rather than loading the entire corpus into memory.
+    srcs = (row.text for row in q.yield_per(1024))
 
-      if cached_results_path.is_file():
+    outcome_counts = collections.Counter()
+    for i, batch in enumerate(labtypes.Chunkify(srcs, batch_size)):
+      outcomes = cache.Get(i)
+
+      if outcomes is not None:
         app.Log(1, "batch %d of %d", i + 1, max_batch)
-        # Read cached results.
-        with open(cached_results_path, "rb") as f:
-          outcomes = pickle.load(f)
       elif FLAGS.summarize_only:
         continue
       else:
         app.Log(1, "batch %d of %d", i + 1, max_batch)
         # Evaluate OpenCL kernels and cache results.
-        batch = srcs[start_idx : start_idx + batch_size]
         testcases = labtypes.flatten(
           [OpenClSourceToTestCases(src) for src in batch]
         )
@@ -251,26 +293,20 @@ def main(argv: typing.List[str]):
         outcomes = [
           GetOutcomeWithDynamicChecks(result, driver) for result in results
         ]
-        with open(cached_results_path, "wb") as f:
-          pickle.dump(outcomes, f)
-
-      all_outcomes += outcomes
-      df = pd.DataFrame(
-        list(zip(all_outcomes, np.ones(len(all_outcomes))))
-        + [("Total", len(all_outcomes))],
+        cache.Put(i, outcomes)
+
+      # Summarize the outcome counts so far. This is built from the counts
+      # rather than the individual outcomes, so it does not grow with the
+      # number of batches run.
+      outcome_counts.update(outcomes)
+      total = sum(outcome_counts.values())
+      summary = pd.DataFrame(
+        sorted(list(outcome_counts.items()) + [("Total", total)]),
         columns=["outcome", "count"],
       )
-      summary = df.groupby("outcome").sum().reset_index()
-      summary["ratio"] = [
-        f"{x:.2%}"
-        for x in
-        # Double the "ratio" values because the 'count' column contains a
-        # grand total row.
-        2 * summary["count"].values / summary["count"].sum()
-      ]
+      summary["ratio"] = [f"{x:.2%}" for x in summary["count"].values / total]
       summary["count"] = [humanize.Commas(int(x)) for x in summary["count"]]
       print(summary)
-      del df
       del summary
 
 
@@ -69,6 +69,14 @@ _JAVA_IMPORT_RE = re.compile(
   r"\s*import\s+(?P<package>[\w\.]+)\.(?P<classname>\w+)\s*;.*"
 )
 
+# Regex to match every java import in a multi-line source. This is equivalent
+# to matching _JAVA_IMPORT_RE against each line, but scans the source once.
+_JAVA_IMPORTS_RE = re.compile(
+  r"^[^\S\n]*import[^\S\n]+(?P<package>[\w\.]+)\.(?P<classname>\w+)"
+  r"[^\S\n]*;",
+  re.MULTILINE,
+)
+
 
 def ImportQueryResults(query, session):
   """Copy results of a query from one session into a new session."""
@@ -111,12 +119,11 @@ def GetJavaImports(src: str) -> typing.Set[typing.Tuple[str, str]]:
   Returns:
     A (possibly empty) set.
   """
-  matches = []
-  for line in src.split("\n"):
-    match = MaybeExtractJavaImport(line)
-    if match:
-      matches.append(match)
-  return {classname: package for package, classname in set(matches)}
+  matches = {
+    (match.group("package"), match.group("classname"))
+    for match in _JAVA_IMPORTS_RE.finditer(src)
+  }
+  return {classname: package for package, classname in matches}
 
 
 def InsertImportCommentHeader(method: str, imports: typing.Dict[str, str]):
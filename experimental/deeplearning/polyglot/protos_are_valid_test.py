@@ -16,10 +16,11 @@ MODULE_UNDER_TEST = None  # No coverage.
 
 def DirContainsProtos(data_path: str, proto_class) -> None:
   """Assert that contains protos of the given class."""
+  # Reuse a single message, clearing it before parsing each file.
+  message = proto_class()
   for path in bazelutil.DataPath(data_path).iterdir():
-    assert pbutil.ProtoIsReadable(
-      bazelutil.DataPath(data_path) / path, proto_class()
-    )
+    message.Clear()
+    assert pbutil.ProtoIsReadable(path, message)
 
 
 def test_clone_lists_are_valid():
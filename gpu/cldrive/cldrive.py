@@ -54,8 +54,7 @@ def main(argv):
   if not src_path.is_file():
     print("File not found:", src_path, file=sys.stderr)
     sys.exit(1)
-  with open(src_path) as f:
-    opencl_kernel = f.read()
+  opencl_kernel = src_path.read_bytes().decode("utf-8")
 
   instance = cldrive_pb2.CldriveInstance(
     device=opencl_environment.proto,
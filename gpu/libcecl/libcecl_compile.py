@@ -34,52 +34,50 @@ LIBCECL_SO = bazelutil.DataPath("phd/gpu/libcecl/libcecl.so")
 LIBCECL_HEADER = bazelutil.DataPath("phd/gpu/libcecl/libcecl.h")
 
 
-def _OpenClCompileAndLinkFlags() -> typing.Tuple[
-  typing.List[str], typing.List[str]
-]:
-  """Private helper method to get device-specific OpenCL flags."""
-  if system.is_linux():
-    return (
-      ["-isystem", str(OPENCL_HEADERS_DIR)],
-      [
-        f"-L{LIBOPENCL_DIR}",
-        f"-Wl,-rpath,{LIBOPENCL_DIR}",
-        "-lOpenCL",
-        "-DCL_SILENCE_DEPRECATION",
-      ],
-    )
-  else:  # macOS
-    return (
-      ["-isystem", str(OPENCL_HEADERS_DIR)],
-      ["-framework", "OpenCL", "-DCL_SILENCE_DEPRECATION"],
-    )
+# Device-specific OpenCL compile and link flags. These are computed once, on
+# import.
+_OPENCL_CFLAGS = ("-isystem", str(OPENCL_HEADERS_DIR))
+if system.is_linux():
+  _OPENCL_LDFLAGS = (
+    f"-L{LIBOPENCL_DIR}",
+    f"-Wl,-rpath,{LIBOPENCL_DIR}",
+    "-lOpenCL",
+    "-DCL_SILENCE_DEPRECATION",
+  )
+else:  # macOS
+  _OPENCL_LDFLAGS = ("-framework", "OpenCL", "-DCL_SILENCE_DEPRECATION")
 
 
 @functools.lru_cache(maxsize=2)
 def OpenClCompileAndLinkFlags(
   opencl_headers: bool = True,
-) -> typing.Tuple[typing.List[str], typing.List[str]]:
-  """Get device-specific OpenCL compile and link flags."""
-  cflags, ldflags = _OpenClCompileAndLinkFlags()
-  if not opencl_headers:
-    cflags = []
-  return cflags, ldflags
+) -> typing.Tuple[typing.Tuple[str, ...], typing.Tuple[str, ...]]:
+  """Get device-specific OpenCL compile and link flags.
+
+  The flags are returned as tuples so that the cached values cannot be
+  modified by callers. Use list() to get a mutable copy.
+  """
+  cflags = _OPENCL_CFLAGS if opencl_headers else ()
+  return cflags, _OPENCL_LDFLAGS
 
 
 @functools.lru_cache(maxsize=2)
 def LibCeclCompileAndLinkFlags(
   opencl_headers: bool = True,
-) -> typing.Tuple[typing.List[str], typing.List[str]]:
+) -> typing.Tuple[typing.Tuple[str, ...], typing.Tuple[str, ...]]:
   """Get device-specific LibCecl compile and link flags.
 
+  The flags are returned as tuples so that the cached values cannot be
+  modified by callers. Use list() to get a mutable copy.
+
   WARNING: Executable compiled with these flags must be executed with the
   environment variables from LibCeclExecutableEnvironmentVariables() to set a
   correct LD_LIBRARY_PATH!
   """
   cflags, ldflags = OpenClCompileAndLinkFlags(opencl_headers=opencl_headers)
   return (
-    cflags + ["-isystem", str(LIBCECL_HEADER.parent)],
-    ldflags + ["-lcecl", f"-L{LIBCECL_SO.parent}"],
+    cflags + ("-isystem", str(LIBCECL_HEADER.parent)),
+    ldflags + ("-lcecl", f"-L{LIBCECL_SO.parent}"),
   )
 
 
@@ -38,7 +38,8 @@ def test_OpenClCompileAndLinkFlags_smoke_test(
   # Create bitcode.
   bitcode_path = tempdir / "a.ll"
   proc = clang.Exec(
-    ["-x", "c", "-", "-S", "-emit-llvm", "-o", str(bitcode_path)] + cflags,
+    ["-x", "c", "-", "-S", "-emit-llvm", "-o", str(bitcode_path)]
+    + list(cflags),
     stdin=c_program_src,
     stdout=None,
     stderr=None,
@@ -49,7 +50,9 @@ def test_OpenClCompileAndLinkFlags_smoke_test(
   # Compile bitcode to executable.
   bin_path = tempdir / "a.out"
   proc = clang.Exec(
-    ["-o", str(bin_path), str(bitcode_path)] + ldflags, stdout=None, stderr=None
+    ["-o", str(bin_path), str(bitcode_path)] + list(ldflags),
+    stdout=None,
+    stderr=None,
   )
   assert not proc.returncode
   assert bin_path.is_file()
@@ -74,12 +74,14 @@ def Run(
     if progress.ctx.i != last_i:
       last_i = progress.ctx.i
       last_progress = current_time
+      # Only redraw the progress bar when progress has been made, rather than
+      # on every wakeup.
+      progress.ctx.Refresh()
     elif patience and (current_time - last_progress) > patience:
       raise OSError(
         f"Failed to make progress after "
         f"{current_time - last_progress:.0f} seconds"
       )
-    progress.ctx.Refresh()
     progress.join(refresh_time)
   progress.ctx.Refresh()
   progress.ctx.bar.close()
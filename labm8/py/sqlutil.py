@@ -55,6 +55,21 @@ absl_flags.DEFINE_boolean(
   '"server has gone away" errors. See:'
   "<https://docs.sqlalchemy.org/en/13/core/pooling.html#disconnect-handling-pessimistic>",
 )
+absl_flags.DEFINE_boolean(
+  "sqlutil_pool_use_lifo",
+  True,
+  "Reuse the most recently returned connection from the pool of a MySQL or "
+  "PostgreSQL database, rather than the least recently returned. This keeps "
+  "the set of active connections small under light load, allowing idle "
+  "connections to be closed by the server-side timeout.",
+)
+absl_flags.DEFINE_integer(
+  "sqlutil_pool_recycle",
+  -1,
+  "The number of seconds after which a pooled connection to a MySQL or "
+  "PostgreSQL database is replaced. Set this below the server's idle "
+  "connection timeout. A value of -1 means connections are never recycled.",
+)
 absl_flags.DEFINE_integer(
   "mysql_engine_pool_size",
   5,
@@ -80,6 +95,32 @@ absl_flags.DEFINE_boolean(
   "constraints, and enables cascaded update/delete statements. See: "
   "https://docs.sqlalchemy.org/en/13/dialects/sqlite.html#foreign-key-support",
 )
+absl_flags.DEFINE_boolean(
+  "sqlite_enable_wal",
+  False,
+  "Use write-ahead logging for SQLite databases, with the synchronous setting "
+  "given by --sqlite_synchronous. With the default synchronous setting this "
+  "avoids an fsync on every commit, which greatly speeds up workloads with "
+  "many small transactions. A commit may be rolled back by a power failure, "
+  "but the database will not be corrupted. WAL mode is persistent, and is not "
+  "supported on network filesystems. See: "
+  "https://www.sqlite.org/wal.html",
+)
+absl_flags.DEFINE_enum(
+  "sqlite_synchronous",
+  "NORMAL",
+  ["OFF", "NORMAL", "FULL", "EXTRA"],
+  "The synchronous setting to use for SQLite databases when "
+  "--sqlite_enable_wal is set. NORMAL is durable against application "
+  "crashes. Use FULL to also make commits durable against power loss. See: "
+  "https://www.sqlite.org/pragma.html#pragma_synchronous",
+)
+absl_flags.DEFINE_integer(
+  "postgresql_executemany_page_size",
+  1000,
+  "The number of rows to send in each multi-row INSERT statement when "
+  "executing a batch of INSERTs on a PostgreSQL database.",
+)
 
 # The Query type is returned by Session.query(). This is a convenience for type
 # annotations.
@@ -248,6 +289,8 @@ def CreateEngine(url: str, must_exist: bool = False) -> sql.engine.Engine:
     # Engine-specific options.
     engine_args["pool_size"] = FLAGS.mysql_engine_pool_size
     engine_args["max_overflow"] = FLAGS.mysql_engine_max_overflow
+    engine_args["pool_use_lifo"] = FLAGS.sqlutil_pool_use_lifo
+    engine_args["pool_recycle"] = FLAGS.sqlutil_pool_recycle
 
     if not query.first():
       if must_exist:
@@ -301,6 +344,17 @@ def CreateEngine(url: str, must_exist: bool = False) -> sql.engine.Engine:
         conn.execute(f"CREATE DATABASE {database}")
     conn.close()
     engine.dispose()
+
+    # Engine-specific options.
+    # Use psycopg2's execute_values() for executemany() calls so that a batch
+    # of INSERTs is sent in a single round trip, rather than one per row. See:
+    # https://docs.sqlalchemy.org/en/13/dialects/postgresql.html#psycopg2-executemany-mode
+    engine_args["executemany_mode"] = "values"
+    engine_args["pool_use_lifo"] = FLAGS.sqlutil_pool_use_lifo
+    engine_args["pool_recycle"] = FLAGS.sqlutil_pool_recycle
+    engine_args[
+      "executemany_values_page_size"
+    ] = FLAGS.postgresql_executemany_page_size
   else:
     raise ValueError(f"Unsupported database URL='{url}'")
 
@@ -338,6 +392,22 @@ def EnableSqliteForeignKeysCallback(dbapi_connection, connection_record):
     cursor.close()
 
 
+@sql.event.listens_for(sql.engine.Engine, "connect")
+def EnableSqliteWalCallback(dbapi_connection, connection_record):
+  """Enable write-ahead logging for SQLite databases.
+
+  See --sqlite_enable_wal for details.
+  """
+  del connection_record
+  if FLAGS.sqlite_enable_wal and isinstance(
+    dbapi_connection, sqlite3.Connection
+  ):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={FLAGS.sqlite_synchronous}")
+    cursor.close()
+
+
 def ResolveUrl(url: str, use_flags: bool = True):
   """Resolve the URL of a database.
 
@@ -839,8 +909,8 @@ def ResilientAddManyAndCommit(db: Database, mapped: typing.Iterable[Base]):
   """Attempt to commit all mapped objects and return those that fail.
 
   This method creates a session and commits the given mapped objects.
-  In case of error, this method will recurse up to O(log(n)) times, committing
-  as many objects that can be as possible.
+  In case of error, the objects are bisected and each half is retried, up to
+  O(log(n)) times, committing as many objects that can be as possible.
 
   Args:
     db: The database to add the objects to.
@@ -852,34 +922,37 @@ def ResilientAddManyAndCommit(db: Database, mapped: typing.Iterable[Base]):
   """
   failures = []
 
-  if not mapped:
-    return failures
-
+  # A stack of [start, end) ranges of mapped objects to commit. Ranges are
+  # pushed right-then-left so that they are committed in order, and a work list
+  # is used rather than recursion so that stack depth is bounded. Objects are
+  # added by index, so no sub-list is copied for each attempt.
   mapped = list(mapped)
-  try:
-    with db.Session(commit=True) as session:
-      session.add_all(mapped)
-  except sql.exc.SQLAlchemyError as e:
-    logging.Log(
-      logging.GetCallingModuleName(),
-      1,
-      "Caught error while committing %d mapped objects: %s",
-      len(mapped),
-      e,
-    )
+  to_commit = [(0, len(mapped))] if mapped else []
+  while to_commit:
+    start, end = to_commit.pop()
+    try:
+      with db.Session(commit=True) as session:
+        for i in range(start, end):
+          session.add(mapped[i])
+    except sql.exc.SQLAlchemyError as e:
+      logging.Log(
+        logging.GetCallingModuleName(),
+        1,
+        "Caught error while committing %d mapped objects: %s",
+        end - start,
+        e,
+      )
 
-    # Divide and conquer. If we're committing only a single object, then a
-    # failure to commit it means that we can do nothing other than return it.
-    # Else, divide the mapped objects in half and attempt to commit as many of
-    # them as possible.
-    if len(mapped) == 1:
-      return mapped
-    else:
-      mid = int(len(mapped) / 2)
-      left = mapped[:mid]
-      right = mapped[mid:]
-      failures += ResilientAddManyAndCommit(db, left)
-      failures += ResilientAddManyAndCommit(db, right)
+      # Divide and conquer. If we're committing only a single object, then a
+      # failure to commit it means that we can do nothing other than return it.
+      # Else, divide the mapped objects in half and attempt to commit as many of
+      # them as possible.
+      if end - start == 1:
+        failures.append(mapped[start])
+      else:
+        mid = start + int((end - start) / 2)
+        to_commit.append((mid, end))
+        to_commit.append((start, mid))
 
   return failures
 
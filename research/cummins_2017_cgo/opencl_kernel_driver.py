@@ -164,7 +164,9 @@ if (get_global_id(0) < c) {
 
     def CompileDriver(libcecl_src: str, binary_path: pathlib.Path):
       proc = clang.Exec(
-        ["-x", "c", "-std=c99", "-", "-o", str(binary_path)] + cflags + ldflags,
+        ["-x", "c", "-std=c99", "-", "-o", str(binary_path)]
+        + list(cflags)
+        + list(ldflags),
         stdin=libcecl_src,
       )
       if proc.returncode:
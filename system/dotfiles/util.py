@@ -88,9 +88,10 @@ def shell_ok(cmd):
   """ run a shell command and return False if error """
   _log_shell(cmd)
   try:
-    subprocess.check_call(
-      cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
+    # The output is discarded, so send it to /dev/null rather than to pipes
+    # which are never read, and which would block a chatty command.
+    with open(os.devnull, "w") as devnull:
+      subprocess.check_call(cmd, shell=True, stdout=devnull, stderr=devnull)
     _log_shell_output("-> 0")
     return True
   except subprocess.CalledProcessError as e:
@@ -261,8 +262,19 @@ def is_compatible(a, b):
     return a == b
 
 
+# A map from binary name to path, populated by which().
+_WHICH_CACHE = {}
+
+
 def which(binary):
-  return find_executable(binary)
+  """ return the path of a binary, or None if not found. Found paths are
+      cached. Misses are not, as tasks may install the binary """
+  path = _WHICH_CACHE.get(binary)
+  if path is None:
+    path = find_executable(binary)
+    if path:
+      _WHICH_CACHE[binary] = path
+  return path
 
 
 def mkdir(path):
@@ -286,12 +298,19 @@ def symlink(src, dst, sudo=False):
   else:
     src_abs = os.path.dirname(dst) + "/" + src
 
+  # Only shell out when we need sudo, else use native calls to save a
+  # fork/exec per check.
+  if sudo:
+    exists = lambda path: shell_ok("sudo -H test -e '{path}'".format(**vars()))
+    readlink = lambda path: shell("sudo -H readlink '{path}'".format(**vars()))
+  else:
+    exists = os.path.exists
+    readlink = os.readlink
+
   # Symlink already exists
-  use_sudo = "sudo -H " if sudo else ""
-  if shell_ok("{use_sudo}test -f '{dst}'".format(**vars())) or shell_ok(
-    "{use_sudo}test -d '{dst}'".format(**vars())
-  ):
-    linkdest = shell("{use_sudo}readlink {dst}".format(**vars())).rstrip()
+  dst_exists = exists(dst)
+  if dst_exists:
+    linkdest = readlink(dst).rstrip()
     if linkdest.startswith("/"):
       linkdest_abs = linkdest
     else:
@@ -299,26 +318,29 @@ def symlink(src, dst, sudo=False):
     if linkdest_abs == src_abs:
       return
 
-  if not (
-    shell_ok("{use_sudo}test -f '{src_abs}'".format(**vars()))
-    or shell_ok("{use_sudo}test -d '{src_abs}'".format(**vars()))
-  ):
+  if not exists(src_abs):
     raise OSError("symlink source '{src}' does not exist".format(**vars()))
   # if shell_ok("{use_sudo}test -d '{dst}'".format(**vars())):
   #     raise OSError("symlink destination '{dst}' is a directory".format(**vars()))
 
-  # Make a backup of existing file:
-  if shell_ok("{use_sudo}test -f '{dst}'".format(**vars())) or shell_ok(
-    "{use_sudo}test -d '{dst}'".format(**vars())
-  ):
-    shell("{use_sudo}mv '{dst}' '{dst}'.backup".format(**vars()))
-
-  # in case of broken symlink
-  shell("{use_sudo}rm -f '{dst}'".format(**vars()))
-
-  # Create the symlink:
   task_print("Creating symlink {dst}".format(**vars()))
-  shell("{use_sudo}ln -s '{src}' '{dst}'".format(**vars()))
+  if sudo:
+    # Make a backup of existing file:
+    if dst_exists:
+      shell("sudo -H mv '{dst}' '{dst}'.backup".format(**vars()))
+    # in case of broken symlink
+    shell("sudo -H rm -f '{dst}'".format(**vars()))
+    # Create the symlink:
+    shell("sudo -H ln -s '{src}' '{dst}'".format(**vars()))
+  else:
+    if dst_exists:
+      logging.debug("$ mv " + dst + " " + dst + ".backup")
+      os.rename(dst, dst + ".backup")
+    if os.path.lexists(dst):
+      logging.debug("$ rm -f " + dst)
+      os.remove(dst)
+    logging.debug("$ ln -s " + src + " " + dst)
+    os.symlink(src, dst)
 
 
 def checksum_file(path):
@@ -397,37 +419,49 @@ def github_repo(user, repo):
     return "https://github.com/{user}/{repo}.git".format(**vars())
 
 
+# A map from task class to whether it is runnable, populated by
+# is_runnable_task().
+_RUNNABLE_CACHE = {}
+
+
 def is_runnable_task(obj):
   """ returns true if object is a task for the current platform """
   # Check that object is a class and inherits from 'Task':
   if not (inspect.isclass(obj) and issubclass(obj, Task) and obj != Task):
     return False
 
-  task = obj()
+  if obj not in _RUNNABLE_CACHE:
+    _RUNNABLE_CACHE[obj] = _is_runnable_task_class(obj)
+  return _RUNNABLE_CACHE[obj]
+
+
+def _is_runnable_task_class(task):
+  """ returns true if a task class is runnable on the current platform. The
+      checks read class attributes only, so no task is instantiated """
   # Check that task is compatible with platform:
   platforms = getattr(task, "__platforms__", [])
   if not any(is_compatible(PLATFORM, x) for x in platforms):
-    msg = "skipping " + type(task).__name__ + " on platform " + PLATFORM
+    msg = "skipping " + task.__name__ + " on platform " + PLATFORM
     logging.debug(msg)
     return False
 
   # Check that hostname is whitelisted (if whitelist is provided):
   hosts = getattr(task, "__hosts__", [])
   if hosts and HOSTNAME not in hosts:
-    msg = "skipping " + type(task).__name__ + " on host " + HOSTNAME
+    msg = "skipping " + task.__name__ + " on host " + HOSTNAME
     logging.debug(msg)
     return False
 
   # Check that task is not excluded:
-  if type(task).__name__ in EXCLUDES:
-    msg = "skipping " + type(task).__name__ + " as it is excluded"
+  if task.__name__ in EXCLUDES:
+    msg = "skipping " + task.__name__ + " as it is excluded"
     logging.debug(msg)
     return False
 
   # Check that task passes all req tests:
   reqs = getattr(task, "__reqs__", [])
   if reqs and not all(req() for req in reqs):
-    msg = "skipping " + type(task).__name__ + ", failed req check"
+    msg = "skipping " + task.__name__ + ", failed req check"
     logging.debug(msg)
     return False
 
@@ -1,49 +1,68 @@
 """Pytest fixtures for //tools/git."""
 import pathlib
+import shutil
+import tempfile
 
 import git
 
 from labm8.py import app
-from labm8.py import fs
 from labm8.py import test
 
 FLAGS = app.FLAGS
 
 
+@test.Fixture(scope="session")
+def repo_with_history_template() -> pathlib.Path:
+  """Test fixture that returns the path of a git repo with history.
+
+  The repo is created once per session and must not be modified. Use the
+  repo_with_history fixture for a copy of it.
+  """
+  with tempfile.TemporaryDirectory(prefix="phd_tools_git_") as d:
+    repo_dir = pathlib.Path(d) / "repo"
+    repo_dir.mkdir()
+    _CreateRepoWithHistory(repo_dir)
+    yield repo_dir
+
+
 @test.Fixture(scope="function")
-def repo_with_history(tempdir: pathlib.Path) -> git.Repo:
+def repo_with_history(
+  tempdir: pathlib.Path, repo_with_history_template: pathlib.Path
+) -> git.Repo:
   """Test fixture that returns a git repo with history."""
-  repo = git.Repo.init(tempdir)
+  repo_dir = tempdir / "repo"
+  shutil.copytree(repo_with_history_template, repo_dir, symlinks=True)
+  yield git.Repo(repo_dir)
+
+
+def _CreateRepoWithHistory(path: pathlib.Path) -> None:
+  """Create a git repo with a three commit history at the given path."""
+  repo = git.Repo.init(path)
   repo_dir = pathlib.Path(repo.working_tree_dir)
 
   # Create the first commit with three files.
-  readme = fs.Write(repo_dir / "README.txt", "Hello, world!\n".encode("utf-8"))
-  (repo_dir / "src").mkdir()
-  main = fs.Write(
-    repo_dir / "src" / "main.c", "int main() { return 5; }".encode("utf-8")
-  )
-  makefile = fs.Write(
-    repo_dir / "src" / "Makefile", "# An empty makefile".encode("utf-8")
-  )
+  src_dir = repo_dir / "src"
+  src_dir.mkdir()
+  readme = repo_dir / "README.txt"
+  readme.write_bytes(b"Hello, world!\n")
+  main = src_dir / "main.c"
+  main.write_bytes(b"int main() { return 5; }")
+  makefile = src_dir / "Makefile"
+  makefile.write_bytes(b"# An empty makefile")
 
   repo.index.add([str(readme), str(main), str(makefile)])
   repo.index.commit("First commit, add some files")
 
   # Change the source file and Makefile in the second commit.
-  main = fs.Write(
-    repo_dir / "src" / "main.c", "int main() { return 0; }".encode("utf-8")
-  )
-  makefile = fs.Write(
-    repo_dir / "src" / "Makefile", "# A modified makefile".encode("utf-8")
-  )
+  main.write_bytes(b"int main() { return 0; }")
+  makefile.write_bytes(b"# A modified makefile")
   repo.index.add([str(main), str(makefile)])
   repo.index.commit("Change return value of program")
 
   # Remove the empty Makefile in the third commit.
-  (repo_dir / "src" / "Makefile").unlink()
+  makefile.unlink()
   repo.index.remove([str(makefile)])
   repo.index.commit("Remove the makefile")
-  yield repo
 
 
 @test.Fixture(scope="function")
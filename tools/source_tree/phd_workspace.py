@@ -6,6 +6,7 @@ import pathlib
 import shutil
 import subprocess
 import typing
+from concurrent import futures
 
 import git
 
@@ -37,15 +38,50 @@ _ALWAYS_EXPORTED_FILES = [
   "tools/workspace_status.sh",  # Needed by .bazelrc
 ]
 
-# A list of relative paths to files which are excluded from export. Glob
+# A set of relative paths to files which are excluded from export. Glob
 # patterns are NOT supported.
-_NEVER_EXPORTED_FILES = []
+_NEVER_EXPORTED_FILES: typing.FrozenSet[str] = frozenset()
+
+
+def _MakeParentDirectories(paths: typing.Iterable[str]) -> None:
+  """Create the parent directories of paths, visiting each directory once."""
+  # Create shallower directories first so that deeper directories need only
+  # create their last component.
+  for dirname in sorted(
+    {os.path.dirname(path) for path in paths},
+    key=lambda path: path.count(os.sep),
+  ):
+    os.makedirs(dirname, exist_ok=True)
+
+
+def _CopyFile(src_path: str, dst_path: str) -> None:
+  """Copy a file, skipping the copy if the destination is already up to date.
+
+  Like rsync, a destination file is considered up to date if it has the same
+  size and modification time as the source. The modification time is
+  preserved when copying so that repeated exports skip unchanged files.
+  """
+  if os.path.isfile(dst_path):
+    src_stat, dst_stat = os.stat(src_path), os.stat(dst_path)
+    if (
+      src_stat.st_size == dst_stat.st_size
+      and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+    ):
+      return
+  shutil.copy2(src_path, dst_path)
 
 
 class PhdWorkspace(bazelutil.Workspace):
   def __init__(self, *args, **kwargs):
     super(PhdWorkspace, self).__init__(*args, **kwargs)
     self._repo = git.Repo(self.workspace_root)
+    # Caches of bazel query results. Queries are expensive, and the workspace
+    # is not expected to change during the lifetime of this object.
+    self._dependent_files_cache: typing.Dict[
+      typing.Tuple[str, typing.FrozenSet[str]], typing.List[pathlib.Path]
+    ] = {}
+    self._build_files_cache: typing.Dict[str, typing.List[pathlib.Path]] = {}
+    self._always_exported_files: typing.Optional[typing.List[str]] = None
 
   @property
   def git_repo(self) -> git.Repo:
@@ -59,29 +95,55 @@ class PhdWorkspace(bazelutil.Workspace):
     else:
       return None
 
+  def GetDependentFiles(
+    self, target: str, excluded_targets: typing.Iterable[str],
+  ) -> typing.List[pathlib.Path]:
+    """Get the file dependencies of the target. Results are cached."""
+    key = (target, frozenset(excluded_targets))
+    if key not in self._dependent_files_cache:
+      self._dependent_files_cache[key] = list(
+        super(PhdWorkspace, self).GetDependentFiles(target, key[1])
+      )
+    return list(self._dependent_files_cache[key])
+
+  def GetBuildFiles(self, target: str) -> typing.List[pathlib.Path]:
+    """Get the BUILD files required for the given target. Results are cached."""
+    if target not in self._build_files_cache:
+      self._build_files_cache[target] = list(
+        super(PhdWorkspace, self).GetBuildFiles(target)
+      )
+    return list(self._build_files_cache[target])
+
   def GetAlwaysExportedFiles(self) -> typing.Iterable[str]:
-    """Get hardcoded additional files to export."""
-    relpaths = []
-    for p in _ALWAYS_EXPORTED_FILES:
-      abspaths = glob.glob(f"{self.workspace_root}/{p}")
-      relpaths += [
-        os.path.relpath(path, self.workspace_root) for path in abspaths
-      ]
-    return relpaths
+    """Get hardcoded additional files to export. Results are cached."""
+    if self._always_exported_files is None:
+      relpaths = []
+      for p in _ALWAYS_EXPORTED_FILES:
+        abspaths = glob.glob(f"{self.workspace_root}/{p}")
+        relpaths += [
+          os.path.relpath(path, self.workspace_root) for path in abspaths
+        ]
+      self._always_exported_files = relpaths
+    return list(self._always_exported_files)
 
   def GetAuxiliaryExportFiles(self, paths: typing.Set[str]) -> typing.List[str]:
     """Get a list of auxiliary files to export."""
-
-    def GlobToPaths(glob_pattern: str) -> typing.List[str]:
-      abspaths = glob.glob(glob_pattern)
-      return [os.path.relpath(path, self.workspace_root) for path in abspaths]
+    # Scan each directory once, rather than globbing once per path and
+    # pattern.
+    dirnames = {(self.workspace_root / path).parent for path in paths}
 
     auxiliary_exports = []
-    for path in paths:
-      dirname = (self.workspace_root / path).parent
-      auxiliary_exports += GlobToPaths(f"{dirname}/DEPS.txt")
-      auxiliary_exports += GlobToPaths(f"{dirname}/README*")
-      auxiliary_exports += GlobToPaths(f"{dirname}/LICENSE*")
+    for dirname in dirnames:
+      if not dirname.is_dir():
+        continue
+      with os.scandir(dirname) as entries:
+        for entry in entries:
+          if entry.name == "DEPS.txt" or entry.name.startswith(
+            ("README", "LICENSE")
+          ):
+            auxiliary_exports.append(
+              os.path.relpath(entry.path, self.workspace_root)
+            )
 
     return auxiliary_exports
 
@@ -103,63 +165,79 @@ class PhdWorkspace(bazelutil.Workspace):
     # Never export `exports_repo` targets.
     excluded_targets = excluded_targets.union('kind("exports_repo", //...)')
 
-    file_set = set(extra_files).union(set(file_move_mapping.values()))
+    file_set = {*extra_files, *file_move_mapping.values()}
     for target in targets:
-      file_set = file_set.union(
-        set(self.GetDependentFiles(target, excluded_targets))
-      )
-      file_set = file_set.union(set(self.GetBuildFiles(target)))
-      file_set = file_set.union(
-        set(self.GetDependentFiles(target, excluded_targets))
-      )
-      file_set = file_set.union(
-        set(self.GetDependentFiles(target, excluded_targets))
-      )
+      file_set.update(self.GetDependentFiles(target, excluded_targets))
+      file_set.update(self.GetBuildFiles(target))
 
-    file_set = file_set.union(set(self.GetAlwaysExportedFiles()))
-    file_set = file_set.union(set(self.GetAuxiliaryExportFiles(file_set)))
+    file_set.update(self.GetAlwaysExportedFiles())
+    file_set.update(self.GetAuxiliaryExportFiles(file_set))
     filtered_files = self.FilterExcludedPaths(file_set)
 
-    return list(sorted(filtered_files))
+    return sorted(filtered_files)
 
   def CopyFilesToDestination(
     self, workspace: bazelutil.Workspace, files: typing.List[str]
   ) -> None:
+    if files:
+      print("\n".join(files))
+
+    # Join paths as strings, since they are built for every file.
+    src_root = str(self.workspace_root)
+    dst_root = str(workspace.workspace_root)
+    src_paths, dst_paths = [], []
     for relpath in files:
-      print(relpath)
+      src_path = os.path.join(src_root, relpath)
+      if not os.path.isfile(src_path):
+        raise OSError(f"File `{relpath}` not found")
 
-      src_path = self.workspace_root / relpath
-      dst_path = workspace.workspace_root / relpath
+      src_paths.append(src_path)
+      dst_paths.append(os.path.join(dst_root, relpath))
 
-      if not src_path.is_file():
-        raise OSError(f"File `{relpath}` not found")
+    _MakeParentDirectories(dst_paths)
 
-      dst_path.parent.mkdir(exist_ok=True, parents=True)
-      shutil.copy(src_path, dst_path)
+    # Copying is I/O bound, so use threads to overlap the copies.
+    with futures.ThreadPoolExecutor(
+      max_workers=min(32, (os.cpu_count() or 1) * 4)
+    ) as executor:
+      # Consume the results to raise any errors.
+      list(executor.map(_CopyFile, src_paths, dst_paths))
 
   def MoveFilesToDestination(
     self,
     workspace: bazelutil.Workspace,
     file_move_mapping: typing.Dict[str, str],
   ) -> None:
+    src_root = str(self.workspace_root)
+    dst_root = str(workspace.workspace_root)
+    _MakeParentDirectories(
+      [
+        os.path.join(dst_root, dst_relpath)
+        for dst_relpath in file_move_mapping.values()
+      ]
+    )
+
     with fs.chdir(workspace.workspace_root):
+      removed_relpaths = []
       for src_relpath, dst_relpath in file_move_mapping.items():
         print(dst_relpath)
 
-        src_path = self.workspace_root / src_relpath
-        dst_path = workspace.workspace_root / dst_relpath
-        if not src_path.is_file():
+        src_path = os.path.join(src_root, src_relpath)
+        dst_path = os.path.join(dst_root, dst_relpath)
+        if not os.path.isfile(src_path):
           raise OSError(f"File `{src_relpath}` not found")
 
-        dst_path.parent.mkdir(exist_ok=True, parents=True)
         # We can't simply `git mv` because in incremental exports, this move
         # may have already been applied. Instead, we manually copy the file
         # from the source workspace, and delete the corresponding file in the
         # destination workspace.
-        shutil.copy(src_path, dst_path)
-        dst_src_path = workspace.workspace_root / src_relpath
-        if dst_src_path.is_file():
-          subprocess.check_call(["git", "rm", src_relpath])
+        _CopyFile(src_path, dst_path)
+        if os.path.isfile(os.path.join(dst_root, src_relpath)):
+          removed_relpaths.append(src_relpath)
+
+      # Remove the moved files with a single git process.
+      if removed_relpaths:
+        subprocess.check_call(["git", "rm", "--"] + removed_relpaths)
 
   def ExportToRepo(
     self,
@@ -174,19 +252,22 @@ class PhdWorkspace(bazelutil.Workspace):
     timestamp = datetime.datetime.utcnow()
 
     # Check now that all of the auxiliary files exist.
+    root = str(self.workspace_root)
     for relpath in extra_files:
-      if not (self.workspace_root / relpath).is_file():
-        raise FileNotFoundError(self.workspace_root / relpath)
+      path = os.path.join(root, relpath)
+      if not os.path.isfile(path):
+        raise FileNotFoundError(path)
     for relpath in file_move_mapping:
-      if not (self.workspace_root / relpath).is_file():
-        raise FileNotFoundError(self.workspace_root / relpath)
+      path = os.path.join(root, relpath)
+      if not os.path.isfile(path):
+        raise FileNotFoundError(path)
 
     # Export the git history.
     app.Log(
       1, "Exporting git history for %s files", humanize.Commas(len(src_files))
     )
-    for file in src_files:
-      print(file)
+    if src_files:
+      print("\n".join(str(file) for file in src_files))
 
     exported_commit_count = export_subtree.ExportSubtree(
       source=self.git_repo, destination=repo, files_of_interest=set(src_files),